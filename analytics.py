@@ -0,0 +1,211 @@
+"""Faollik tahlili: DAU, yangi/qaytgan foydalanuvchilar va haftalik retention kogortalari.
+
+Ma'lumotlar bazadan ixcham ustunli massivlar (user_id, epoch vaqt) ko'rinishida
+bo'laklab o'qiladi va NumPy vektor amallari bilan hisoblanadi. Har bir bo'lak
+darhol noyob (foydalanuvchi, kun) juftlariga qisqartiriladi, shuning uchun xotira
+qatorlar soniga emas, faol juftlar soniga bog'liq. Hisobot export.py dagi ishchi
+jarayonda tayyorlanadi (build_report).
+"""
+import csv
+import io
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+import zipfile
+from datetime import date, timedelta
+
+import numpy as np
+
+from config import ANALYTICS_DAYS, ANALYTICS_WEEKS
+from database import DB_NAME
+
+CHUNK_SIZE = 200_000
+DAY = 86400
+# Kunlar mahalliy sana bo'yicha ajratiladi
+TZ_OFFSET = time.localtime().tm_gmtoff
+# 1970-01-01 payshanba edi; haftalar dushanbadan boshlanadi
+WEEK_SHIFT = 3
+# (user_id << DAY_BITS) | kun — juftni bitta int64 kalitga joylash
+DAY_BITS = 20
+DAY_MASK = (1 << DAY_BITS) - 1
+
+
+def to_days(timestamps):
+    """Epoch soniyalarni mahalliy kun raqamiga aylantiradi (1970-01-01 dan)."""
+    return (timestamps + TZ_OFFSET) // DAY
+
+
+def to_weeks(days):
+    return (days + WEEK_SHIFT) // 7
+
+
+def day_to_date(day):
+    return date(1970, 1, 1) + timedelta(days=int(day))
+
+
+def sorted_unique(values):
+    """Tartiblangan noyob qiymatlar (np.unique dan tezroq: faqat sort va qo'shnilarni solishtirish)."""
+    values = np.sort(values)
+    if len(values) < 2:
+        return values
+    keep = np.empty(len(values), dtype=bool)
+    keep[0] = True
+    np.not_equal(values[1:], values[:-1], out=keep[1:])
+    return values[keep]
+
+
+def reduce_activity(user_ids, timestamps, start_day):
+    """Bo'lakni start_day dan boshlab noyob (user, kun) kalitlariga qisqartiradi."""
+    days = to_days(timestamps)
+    mask = days >= start_day
+    return sorted_unique((user_ids[mask] << DAY_BITS) | days[mask])
+
+
+def merge_activity(parts):
+    return sorted_unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+
+
+def _load_chunks(conn, query, params=()):
+    cursor = conn.execute(query, params)
+    while True:
+        rows = cursor.fetchmany(CHUNK_SIZE)
+        if not rows:
+            return
+        yield np.array(rows, dtype=np.int64)
+
+
+def load_activity(conn, start_day):
+    """start_day dan keyingi faollik kalitlarini o'qiydi: xom so'rovlar va siqilgan kunlik yig'malardan."""
+    since = start_day * DAY - TZ_OFFSET
+    parts = []
+    for query in ("SELECT user_id, requested_ts FROM file_requests WHERE requested_ts >= ?",
+                  "SELECT user_id, first_ts FROM daily_user_code_requests WHERE last_ts >= ?"):
+        parts.extend(reduce_activity(chunk[:, 0], chunk[:, 1], start_day)
+                     for chunk in _load_chunks(conn, query, (since,)))
+    return merge_activity(parts)
+
+
+def load_signups(conn):
+    """Foydalanuvchilar (user_id bo'yicha tartiblangan) va ularning ro'yxatdan o'tgan kuni."""
+    chunks = list(_load_chunks(conn, "SELECT user_id, created_ts FROM users WHERE created_ts IS NOT NULL ORDER BY user_id"))
+    if not chunks:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    rows = np.concatenate(chunks)
+    return rows[:, 0], to_days(rows[:, 1])
+
+
+def _signup_days_for(users, signup_users, signup_days):
+    """Har bir user uchun ro'yxatdan o'tgan kun; noma'lumlari -1."""
+    if not len(signup_users):
+        return np.full(len(users), -1, dtype=np.int64)
+    index = np.minimum(np.searchsorted(signup_users, users), len(signup_users) - 1)
+    return np.where(signup_users[index] == users, signup_days[index], -1)
+
+
+def daily_activity(keys, signup_users, signup_days, start_day, end_day):
+    """Kunlik jadval: [(sana, DAU, yangi faollar, qaytganlar, ro'yxatdan o'tganlar), ...].
+
+    Yangi — shu kuni ro'yxatdan o'tib, shu kuni so'rov yuborganlar; qolgan faollar qaytganlar.
+    """
+    size = end_day - start_day + 1
+    users = keys >> DAY_BITS
+    days = keys & DAY_MASK
+    first_days = _signup_days_for(users, signup_users, signup_days)
+    dau = np.bincount(days - start_day, minlength=size)
+    new = np.bincount(days[first_days == days] - start_day, minlength=size)
+    window = (signup_days >= start_day) & (signup_days <= end_day)
+    signups = np.bincount(signup_days[window] - start_day, minlength=size)
+    return [
+        (day_to_date(start_day + i).isoformat(), int(dau[i]), int(new[i]), int(dau[i] - new[i]), int(signups[i]))
+        for i in range(size)
+    ]
+
+
+def weekly_cohorts(keys, signup_users, signup_days, first_week, last_week):
+    """Haftalik retention: [(hafta boshi, kogorta hajmi, [0-hafta %, 1-hafta %, ...]), ...].
+
+    Kogorta — shu haftada ro'yxatdan o'tganlar; k-hafta ulushi — ro'yxatdan o'tgandan
+    k hafta keyin kamida bitta so'rov yuborganlar.
+    """
+    weeks_count = last_week - first_week + 1
+    users = keys >> DAY_BITS
+    weeks = to_weeks(keys & DAY_MASK)
+    cohort_weeks = to_weeks(_signup_days_for(users, signup_users, signup_days))
+    offsets = weeks - cohort_weeks
+    mask = (cohort_weeks >= first_week) & (cohort_weeks <= last_week) & (offsets >= 0)
+    # Har bir foydalanuvchi haftada bir marta hisoblanadi
+    user_weeks = sorted_unique((users[mask] << 16) | ((cohort_weeks[mask] - first_week) << 8) | offsets[mask])
+    cells = ((user_weeks >> 8) & 0xFF) * weeks_count + (user_weeks & 0xFF)
+    matrix = np.bincount(cells, minlength=weeks_count * weeks_count).reshape(weeks_count, weeks_count)
+    all_cohort_weeks = to_weeks(signup_days)
+    in_range = (all_cohort_weeks >= first_week) & (all_cohort_weeks <= last_week)
+    sizes = np.bincount(all_cohort_weeks[in_range] - first_week, minlength=weeks_count)
+    result = []
+    for i in range(weeks_count):
+        shares = matrix[i, :weeks_count - i] / sizes[i] * 100 if sizes[i] else np.zeros(weeks_count - i)
+        week_start = day_to_date((first_week + i) * 7 - WEEK_SHIFT)
+        result.append((week_start.isoformat(), int(sizes[i]), [round(float(share), 1) for share in shares]))
+    return result
+
+
+def compute(conn, days=ANALYTICS_DAYS, weeks=ANALYTICS_WEEKS, now=None):
+    """Bazadan o'qib, kunlik va haftalik jadvallarni qaytaradi."""
+    today = int(to_days(int(now or time.time())))
+    last_week = to_weeks(today)
+    first_week = last_week - weeks + 1
+    start_day = min(today - days + 1, first_week * 7 - WEEK_SHIFT)
+    started = time.perf_counter()
+    keys = load_activity(conn, start_day)
+    signup_users, signup_days = load_signups(conn)
+    loaded = time.perf_counter()
+    daily = daily_activity(keys[(keys & DAY_MASK) > today - days], signup_users, signup_days, today - days + 1, today)
+    cohorts = weekly_cohorts(keys, signup_users, signup_days, first_week, last_week)
+    logging.info(f"Tahlil: {len(keys)} faol juft, o'qish {loaded - started:.2f} s, "
+                 f"hisoblash {time.perf_counter() - loaded:.2f} s")
+    return daily, cohorts
+
+
+DAILY_HEADER = ["Sana", "Faol foydalanuvchilar (DAU)", "Yangi", "Qaytgan", "Ro‘yxatdan o‘tganlar"]
+
+
+def _cohort_header(weeks):
+    return ["Kogorta (hafta boshi)", "Hajmi"] + [f"{i}-hafta, %" for i in range(weeks)]
+
+
+def build_report(fmt="xlsx", days=ANALYTICS_DAYS, weeks=ANALYTICS_WEEKS):
+    """Hisobot faylini yozadi va (yo'l, fayl nomi) ni qaytaradi. Ishchi jarayonda bajariladi."""
+    conn = sqlite3.connect(f"file:{DB_NAME}?mode=ro", uri=True)
+    try:
+        daily, cohorts = compute(conn, days, weeks)
+    finally:
+        conn.close()
+    cohort_rows = [[week_start, size] + shares for week_start, size, shares in cohorts]
+    suffix = ".zip" if fmt == "csv" else ".xlsx"
+    fd, path = tempfile.mkstemp(prefix="analytics_", suffix=suffix)
+    os.close(fd)
+    try:
+        if fmt == "csv":
+            with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+                for name, header, rows in (("daily_activity.csv", DAILY_HEADER, daily),
+                                           ("retention_cohorts.csv", _cohort_header(weeks), cohort_rows)):
+                    buffer = io.StringIO()
+                    writer = csv.writer(buffer)
+                    writer.writerow(header)
+                    writer.writerows(rows)
+                    archive.writestr(name, "\ufeff" + buffer.getvalue())
+        else:
+            from openpyxl import Workbook
+            workbook = Workbook(write_only=True)
+            for title, header, rows in (("Kunlik faollik", DAILY_HEADER, daily),
+                                        ("Retention", _cohort_header(weeks), cohort_rows)):
+                sheet = workbook.create_sheet(title)
+                sheet.append(header)
+                for row in rows:
+                    sheet.append(list(row))
+            workbook.save(path)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, "analytics" + suffix
@@ -0,0 +1,333 @@
+"""database.py funksiyalarining event loop'ni bloklamaydigan (asinxron) variantlari.
+
+O'qish so'rovlari bir nechta oqimda, yozish so'rovlari esa yagona yozuvchi
+oqimda bajariladi.
+"""
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+from config import (DB_READ_POOL_SIZE, WRITE_BATCH_SIZE, WRITE_FLUSH_INTERVAL, DB_MAINTENANCE_INTERVAL,
+                    MIGRATION_BATCH_SIZE, MIGRATION_BATCH_PAUSE, REQUEST_RETENTION_DAYS, RETENTION_INTERVAL,
+                    RETENTION_BATCH_SIZE, RETENTION_BATCH_PAUSE, RETENTION_VACUUM_PAGES)
+
+_read_executor = ThreadPoolExecutor(max_workers=DB_READ_POOL_SIZE, thread_name_prefix="db-read")
+_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+
+async def run_read(func, *args, **kwargs):
+    """Sinxron o'qish funksiyasini o'quvchi oqimlarda bajaradi."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_read_executor, functools.partial(func, *args, **kwargs))
+
+async def run_write(func, *args, **kwargs):
+    """Sinxron yozish funksiyasini yozuvchi oqimda bajaradi."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_write_executor, functools.partial(func, *args, **kwargs))
+
+def _reader(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_read(func, *args, **kwargs)
+    return wrapper
+
+def _writer(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_write(func, *args, **kwargs)
+    return wrapper
+
+add_file = _writer(database.add_file)
+add_files_bulk = _writer(database.add_files_bulk)
+add_file_group = _writer(database.add_file_group)
+remove_file = _writer(database.remove_file)
+create_broadcast_job = _writer(database.create_broadcast_job)
+set_broadcast_job_status = _writer(database.set_broadcast_job_status)
+save_broadcast_checkpoint = _writer(database.save_broadcast_checkpoint)
+add_channel = _writer(database.add_channel)
+remove_channel = _writer(database.remove_channel)
+set_channel_member = _writer(database.set_channel_member)
+clear_channel_members = _writer(database.clear_channel_members)
+rebuild_rollups = _writer(database.rebuild_rollups)
+enable_incremental_vacuum = _writer(database.enable_incremental_vacuum)
+
+get_user = _reader(database.get_user)
+get_user_count = _reader(database.get_user_count)
+get_active_user_count = _reader(database.get_active_user_count)
+count_active_users_after = _reader(database.count_active_users_after)
+get_user_ids_page = _reader(database.get_user_ids_page)
+get_next_broadcast_job = _reader(database.get_next_broadcast_job)
+is_file_code_exists = _reader(database.is_file_code_exists)
+get_channel_members = _reader(database.get_channel_members)
+get_user_requests = _reader(database.get_user_requests)
+get_user_request_stats = _reader(database.get_user_request_stats)
+get_file_codes_page = _reader(database.get_file_codes_page)
+count_files = _reader(database.count_files)
+get_request_totals = _reader(database.get_request_totals)
+get_top_codes = _reader(database.get_top_codes)
+get_code_histogram = _reader(database.get_code_histogram)
+
+async def iter_user_ids(after_user_id=0, page_size=1000):
+    """Foydalanuvchi ID'larini sahifalab, bittadan qaytaradi; xotirada faqat bitta sahifa turadi."""
+    while True:
+        page = await get_user_ids_page(after_user_id, page_size)
+        if not page:
+            return
+        for user_id in page:
+            yield user_id
+        after_user_id = page[-1]
+
+async def get_file(file_code):
+    """Fayl ma'lumotlarini qaytaradi; keshda bo'lsa oqimga o'tmaydi."""
+    cached = database.file_cache.get(file_code, database._NOT_CACHED)
+    if cached is not database._NOT_CACHED:
+        return cached
+    return await run_read(database.load_file, file_code)
+
+async def get_channels():
+    """Majburiy obuna kanallari; xotirada bo'lsa oqimga o'tmaydi."""
+    if database._channels_cache is not None:
+        return database.get_channels()
+    return await run_read(database.get_channels)
+
+class WriteBehindQueue:
+    """Qatorlarni xotirada yig'ib, bitta executemany tranzaksiyasida yozadi.
+
+    Navbat max_size ga yetganda yoki max_delay soniya o'tganda yoziladi.
+    """
+
+    def __init__(self, name, flush_func, max_size=WRITE_BATCH_SIZE, max_delay=WRITE_FLUSH_INTERVAL):
+        self.name = name
+        self.flush_func = flush_func
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self._rows = []
+        self._full = None
+        self._task = None
+        self._stopping = False
+        self.flushes = 0
+        self.rows_written = 0
+        self.max_depth = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+
+    def add(self, row):
+        self._rows.append(row)
+        self.max_depth = max(self.max_depth, len(self._rows))
+        if len(self._rows) >= self.max_size and self._full is not None:
+            self._full.set()
+
+    def start(self):
+        self._full = asyncio.Event()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"{self.name} navbatini yozishda xatolik: {e}")
+
+    async def flush(self):
+        """Navbatdagi barcha qatorlarni yozadi."""
+        if not self._rows:
+            return
+        rows, self._rows = self._rows, []
+        started = time.monotonic()
+        try:
+            await run_write(self.flush_func, rows)
+        except Exception:
+            # Yozilmagan qatorlarni keyingi urinish uchun qaytarish
+            self._rows[:0] = rows
+            raise
+        latency = time.monotonic() - started
+        self.flushes += 1
+        self.rows_written += len(rows)
+        self.last_flush_latency = latency
+        self.max_flush_latency = max(self.max_flush_latency, latency)
+
+    async def stop(self):
+        """Fon vazifasini to'xtatib, qolgan qatorlarni yozadi.
+
+        Vazifa bekor qilinmaydi: yozish o'rtasida bekor qilish olingan qatorlarni yo'qotadi.
+        Shuning uchun to'xtash bayrog'i qo'yilib, sikl o'zi tugashi kutiladi.
+        """
+        if self._task is not None:
+            self._stopping = True
+            self._full.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def stats(self):
+        return {
+            "depth": len(self._rows),
+            "max_depth": self.max_depth,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "last_flush_latency": self.last_flush_latency,
+            "max_flush_latency": self.max_flush_latency,
+        }
+
+user_queue = WriteBehindQueue("users", database.add_users_bulk)
+file_request_queue = WriteBehindQueue("file_requests", database.add_file_requests_bulk)
+inactive_user_queue = WriteBehindQueue("inactive_users", database.deactivate_users_bulk)
+
+WRITE_QUEUES = (user_queue, file_request_queue, inactive_user_queue)
+
+async def add_user(user_id, first_name, last_name, username):
+    """Foydalanuvchini yozish navbatiga qo'shadi."""
+    user_queue.add((user_id, first_name, last_name, username, int(time.time())))
+
+def deactivate_user(user_id, reason):
+    """Foydalanuvchini nofaol deb belgilash navbatiga qo'shadi."""
+    inactive_user_queue.add((reason, int(time.time()), user_id))
+
+async def add_file_request(user_id, file_code):
+    """Fayl so‘rovini yozish navbatiga qo'shadi."""
+    file_request_queue.add((user_id, file_code, int(time.time())))
+
+_maintenance_task = None
+_backfill_task = None
+_retention_task = None
+
+async def migrate():
+    """Sxema migratsiyalarini yozuvchi oqimda bajaradi."""
+    return await run_write(database.migrate)
+
+async def backfill_timestamps():
+    """Eski TEXT vaqtlarni kichik partiyalarda epoch ustunlarga ko'chiradi.
+
+    Holat backfill_progress da saqlanadi: tugagan jadvallar o'tkazib yuboriladi, uzilgan joydan davom etiladi.
+    Har bir partiya alohida tranzaksiya, oralarida pauza bor — asosiy yozuvlar to'xtab qolmaydi.
+    """
+    for table, text_column, ts_column in database.TIMESTAMP_COLUMNS:
+        progress = await run_read(database.get_backfill_progress, f"{table}.{ts_column}")
+        if progress is None:
+            continue
+        next_id, max_id = progress
+        converted = 0
+        for after_id in range(next_id, max_id, MIGRATION_BATCH_SIZE):
+            converted += await run_write(database.backfill_timestamps_batch, table, text_column,
+                                         ts_column, after_id, MIGRATION_BATCH_SIZE)
+            await asyncio.sleep(MIGRATION_BATCH_PAUSE)
+        if converted:
+            logging.info(f"{table}.{text_column}: {converted} ta qator epoch formatiga o'tkazildi")
+
+async def seed_rollups():
+    """Migratsiyadan oldingi so'rovlarni yig'ma jadvallarga kichik partiyalarda qo'shadi."""
+    for name in database.ROLLUP_BACKFILLS:
+        progress = await run_read(database.get_backfill_progress, name)
+        if progress is None:
+            continue
+        next_id, max_id = progress
+        seeded = 0
+        for after_id in range(next_id, max_id, MIGRATION_BATCH_SIZE):
+            seeded += await run_write(database.seed_rollups_batch, name, after_id, MIGRATION_BATCH_SIZE)
+            await asyncio.sleep(MIGRATION_BATCH_PAUSE)
+        if seeded:
+            logging.info(f"{name}: {seeded} ta eski so'rov yig'malarga qo'shildi")
+
+async def _run_backfills():
+    # Yig'malar epoch vaqtlardan hisoblanadi, shuning uchun avval vaqtlar ko'chiriladi
+    await backfill_timestamps()
+    await seed_rollups()
+
+async def _maintenance_loop():
+    while True:
+        await asyncio.sleep(DB_MAINTENANCE_INTERVAL)
+        try:
+            busy, log_pages, checkpointed = await run_write(database.run_maintenance)
+            logging.info(f"SQLite checkpoint: {checkpointed}/{log_pages} sahifa (busy={busy})")
+        except Exception as e:
+            logging.error(f"SQLite texnik xizmatida xatolik: {e}")
+
+async def compact_file_requests(retention_days=REQUEST_RETENTION_DAYS):
+    """Saqlash muddati o'tgan xom so'rovlarni kunlik yig'maga siqadi va joyni bo'shatadi.
+
+    Har bir partiya alohida qisqa tranzaksiya, oralarida pauza bor — yozish navbatlari to'xtab qolmaydi.
+    """
+    cutoff = database.local_day_start(time.time() - retention_days * 86400)
+    before_id = await run_read(database.find_compaction_boundary, cutoff)
+    for name in database.ROLLUP_BACKFILLS:
+        # Hali yig'malarga qo'shilmagan qatorlar o'chirilmasin
+        progress = await run_read(database.get_backfill_progress, name)
+        if progress is not None:
+            before_id = min(before_id, progress[0] + 1)
+    after_id = 0
+    compacted = 0
+    while True:
+        last_id, count = await run_write(database.compact_file_requests_batch, after_id, before_id, cutoff,
+                                         RETENTION_BATCH_SIZE)
+        if last_id is None:
+            break
+        after_id = last_id
+        compacted += count
+        await asyncio.sleep(RETENTION_BATCH_PAUSE)
+    await run_write(database.prune_hourly_rollups, cutoff)
+    await _reclaim_free_pages()
+    if compacted:
+        logging.info(f"file_requests: {compacted} ta eski so'rov kunlik yig'maga siqildi")
+    return compacted
+
+_vacuum_warned = False
+
+async def _reclaim_free_pages():
+    """Bo'sh sahifalarni RETENTION_VACUUM_PAGES tadan qaytaradi, qadam hech narsa bo'shatmaguncha."""
+    global _vacuum_warned
+    while True:
+        result = await run_write(database.incremental_vacuum, RETENTION_VACUUM_PAGES)
+        if result is None:
+            if not _vacuum_warned:
+                _vacuum_warned = True
+                logging.warning("Baza auto_vacuum = INCREMENTAL rejimida emas: siqilgan so'rovlar joyi faylga "
+                                "qaytarilmaydi. Bir martalik o'tkazish uchun adminlar /enable_vacuum buyrug'ini bersin.")
+            return
+        freed, remaining = result
+        if not freed or not remaining:
+            return
+        await asyncio.sleep(RETENTION_BATCH_PAUSE)
+
+async def _retention_loop():
+    while True:
+        await asyncio.sleep(RETENTION_INTERVAL)
+        try:
+            await compact_file_requests()
+        except Exception as e:
+            logging.error(f"So'rovlarni siqishda xatolik: {e}")
+
+def start():
+    """Kechiktirilgan yozish navbatlari va texnik xizmat vazifalarini ishga tushiradi."""
+    global _maintenance_task, _backfill_task, _retention_task
+    for queue in WRITE_QUEUES:
+        queue.start()
+    if DB_MAINTENANCE_INTERVAL > 0:
+        _maintenance_task = asyncio.create_task(_maintenance_loop())
+    if REQUEST_RETENTION_DAYS > 0:
+        _retention_task = asyncio.create_task(_retention_loop())
+    _backfill_task = asyncio.create_task(_run_backfills())
+
+def write_queue_stats():
+    return {queue.name: queue.stats() for queue in WRITE_QUEUES}
+
+async def shutdown():
+    """Navbatlarni yozib, oqimlarni to'xtatadi va ulanishlarni yopadi."""
+    for task in (_maintenance_task, _backfill_task, _retention_task):
+        if task is not None:
+            task.cancel()
+    for queue in WRITE_QUEUES:
+        try:
+            await queue.stop()
+        except Exception as e:
+            logging.error(f"{queue.name} navbatini yozishda xatolik: {e}")
+    _write_executor.shutdown(wait=True)
+    _read_executor.shutdown(wait=True)
+    database.close_connections()
@@ -0,0 +1,138 @@
+"""analytics.py uchun vaqt o'lchovlari: sun'iy 10M qatorli so'rovlar to'plamida.
+
+    python bench_analytics.py | tee bench_output.txt
+    python bench_analytics.py --rows 10000000 --sqlite 2000000   # SQLite'dan o'qishni ham o'lchash
+
+Vektorli hisoblash bo'laklab (analytics.CHUNK_SIZE) bajariladi — xuddi bazadan o'qilgandek.
+Taqqoslash uchun oddiy Python tsikli (set/dict) --baseline qatorda o'lchanadi.
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+import analytics
+from analytics import CHUNK_SIZE, DAY
+
+DAYS = 90
+WEEKS = 12
+
+
+def synthetic_users(users, now, rng):
+    user_ids = np.arange(1, users + 1, dtype=np.int64) * 7919 + 100_000_000
+    created = now - rng.integers(0, DAYS * DAY, size=users)
+    return user_ids, created
+
+
+def synthetic_requests(rows, user_ids, created, now, rng):
+    """(user_id, requested_ts) bo'laklari: har bir so'rov foydalanuvchi ro'yxatdan o'tgandan keyin."""
+    for start in range(0, rows, CHUNK_SIZE):
+        size = min(CHUNK_SIZE, rows - start)
+        index = rng.integers(0, len(user_ids), size=size)
+        span = now - created[index]
+        yield user_ids[index], created[index] + (rng.random(size) * span).astype(np.int64)
+
+
+def timed(label, func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    print(f"{label:<44} {time.perf_counter() - started:8.2f} s")
+    return result
+
+
+def vectorized(chunks, user_ids, created, now):
+    today = int(analytics.to_days(now))
+    last_week = analytics.to_weeks(today)
+    first_week = last_week - WEEKS + 1
+    start_day = min(today - DAYS + 1, first_week * 7 - analytics.WEEK_SHIFT)
+    order = np.argsort(user_ids)
+    signup_users, signup_days = user_ids[order], analytics.to_days(created[order])
+    parts = timed("  bo'laklarni (user, kun) ga qisqartirish",
+                  lambda: [analytics.reduce_activity(users, ts, start_day) for users, ts in chunks])
+    keys = timed("  bo'laklarni birlashtirish", analytics.merge_activity, parts)
+    timed("  DAU / yangi / qaytgan", analytics.daily_activity, keys, signup_users, signup_days,
+          today - DAYS + 1, today)
+    timed("  haftalik retention kogortalari", analytics.weekly_cohorts, keys, signup_users, signup_days,
+          first_week, last_week)
+    return keys
+
+
+def baseline(chunks, created_by_user):
+    """Qatorma-qator Python: kun bo'yicha faollar va foydalanuvchi haftalari."""
+    active = {}
+    user_weeks = {}
+    for users, timestamps in chunks:
+        for user_id, ts in zip(users.tolist(), timestamps.tolist()):
+            day = datetime.fromtimestamp(ts).date()
+            active.setdefault(day, set()).add(user_id)
+            user_weeks.setdefault(user_id, set()).add(day.isocalendar()[:2])
+    new = {day: sum(1 for u in users if datetime.fromtimestamp(created_by_user[u]).date() == day)
+           for day, users in active.items()}
+    return active, new, user_weeks
+
+
+def sqlite_load(rows, user_ids, created, now, rng):
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE file_requests (id INTEGER PRIMARY KEY, user_id INTEGER, file_code TEXT, requested_ts INTEGER)")
+        conn.execute("CREATE TABLE daily_user_code_requests (user_id INTEGER, day TEXT, file_code TEXT, "
+                     "request_count INTEGER, first_ts INTEGER, last_ts INTEGER)")
+        for users, ts in synthetic_requests(rows, user_ids, created, now, rng):
+            conn.executemany("INSERT INTO file_requests (user_id, file_code, requested_ts) VALUES (?, '1', ?)",
+                             zip(users.tolist(), ts.tolist()))
+        conn.commit()
+        start_day = int(analytics.to_days(now)) - DAYS + 1
+        keys = timed(f"SQLite'dan o'qish + qisqartirish ({rows:,} qator)", analytics.load_activity, conn, start_day)
+        print(f"  {len(keys):,} faol juft")
+        conn.close()
+    finally:
+        os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--baseline", type=int, default=1_000_000, help="Python tsikli uchun qatorlar (0 — o'tkazib yuborish)")
+    parser.add_argument("--sqlite", type=int, default=0, help="SQLite orqali o'qish uchun qatorlar")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    now = int(time.time())
+    user_ids, created = synthetic_users(args.users, now, rng)
+    chunks = timed(f"Sun'iy ma'lumot: {args.rows:,} so'rov, {args.users:,} foydalanuvchi",
+                   lambda: list(synthetic_requests(args.rows, user_ids, created, now, rng)))
+
+    started = time.perf_counter()
+    print("NumPy (vektorli):")
+    keys = vectorized(chunks, user_ids, created, now)
+    total = time.perf_counter() - started
+    print(f"{'  jami':<44} {total:8.2f} s  ({args.rows / total / 1e6:.1f}M qator/s, {len(keys):,} faol juft)")
+
+    if args.baseline:
+        subset = []
+        remaining = args.baseline
+        for users, ts in chunks:
+            if remaining <= 0:
+                break
+            subset.append((users[:remaining], ts[:remaining]))
+            remaining -= len(users)
+        created_by_user = dict(zip(user_ids.tolist(), created.tolist()))
+        started = time.perf_counter()
+        baseline(subset, created_by_user)
+        elapsed = time.perf_counter() - started
+        print(f"{f'Python tsikli ({args.baseline:,} qator)':<44} {elapsed:8.2f} s  "
+              f"(~{elapsed * args.rows / args.baseline:.0f} s {args.rows:,} qator uchun)")
+
+    if args.sqlite:
+        sqlite_load(args.sqlite, user_ids, created, now, rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Bitta update'ni dispatcher orqali yo'naltirish narxini o'lchaydi (mikro-benchmark).
+
+Ikki variant solishtiriladi. "oldin": bot.py dagi kabi har bir admin tugmasi
+alohida lambda-filtrli handler, admin tekshiruvi esa ro'yxatda. "keyin": bitta
+handler tugma matnini lug'atdan topadi, admin tekshiruvi frozenset'da.
+Handlerlar hech narsa qilmaydi, shuning uchun faqat filtrlash narxi o'lchanadi.
+
+    python bench_dispatch.py | tee bench_output.txt
+"""
+import asyncio
+import time
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.dispatcher.handler import SkipHandler
+
+BUTTONS = [
+    "📈 Umumiy statistika", "📊 Statistika", "📥 Excelni yuklash", "📤 Fayl yuklash",
+    "👤 Foydalanuvchi statistikasi", "📋 Fayl kodlari ro‘yxati", "🗑 Fayl o‘chirish", "📢 Reklama",
+    "📝 SMS", "🖼 Rasm", "🎥 Video", "📁 Fayl", "🎞 GIF", "🎙 Ovozli xabar", "📍 Lokatsiya",
+    "🎵 Musiqa", "🔗 Majburiy obuna", "➕ Kanal qo'shish", "➖ Kanalni olib tashlash", "📋 Kanallar ro'yxati",
+]
+BACK_BUTTON = "🔙 Orqaga"
+ADMIN_ID = 1
+ADMIN_LIST = list(range(100, 110)) + [ADMIN_ID]
+STATE_HANDLERS = 6
+
+handled = []
+
+
+async def noop(message):
+    handled.append(message.text)
+
+
+def build_before():
+    dp = Dispatcher(Bot("123:abc"), storage=MemoryStorage())
+    dp.register_message_handler(noop, lambda message: message.text.isdigit(), state=None)
+
+    def make_handler(text):
+        async def handler(message):
+            if message.from_user.id not in ADMIN_LIST:
+                return
+            handled.append(text)
+        return handler
+
+    for text in BUTTONS[:5]:
+        dp.register_message_handler(make_handler(text), lambda message, text=text: message.text == text)
+    for number in range(STATE_HANDLERS):
+        dp.register_message_handler(noop, state=f"S:{number}")
+    for text in BUTTONS[5:]:
+        dp.register_message_handler(make_handler(text), lambda message, text=text: message.text == text)
+    dp.register_message_handler(make_handler(BACK_BUTTON), lambda message: message.text == BACK_BUTTON, state="*")
+    dp.register_message_handler(noop)
+    return dp
+
+
+def build_after():
+    dp = Dispatcher(Bot("123:abc"), storage=MemoryStorage())
+    admins = frozenset(ADMIN_LIST)
+    buttons = {text: (noop, False) for text in BUTTONS}
+    buttons[BACK_BUTTON] = (noop, True)
+    dp.register_message_handler(noop, lambda message: message.text.isdigit(), state=None)
+
+    async def route(message, state):
+        handler, any_state = buttons[message.text]
+        if not any_state and await state.get_state() is not None:
+            raise SkipHandler()
+        await handler(message)
+
+    dp.register_message_handler(
+        route, lambda message: message.text in buttons and message.from_user.id in admins, state="*")
+    for number in range(STATE_HANDLERS):
+        dp.register_message_handler(noop, state=f"S:{number}")
+    dp.register_message_handler(noop)
+    return dp
+
+
+def make_update(update_id, user_id, text):
+    return types.Update(**{
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Test"},
+            "text": text,
+        },
+    })
+
+
+SCENARIOS = [
+    ("foydalanuvchi: raqamli kod", 2000, "12345"),
+    ("foydalanuvchi: boshqa matn", 2000, "salom"),
+    ("foydalanuvchi: tugma matni", 2000, BUTTONS[-1]),
+    ("admin: birinchi tugma", ADMIN_ID, BUTTONS[0]),
+    ("admin: oxirgi tugma", ADMIN_ID, BUTTONS[-1]),
+]
+
+
+async def measure(dp, user_id, text, iterations):
+    Bot.set_current(dp.bot)
+    Dispatcher.set_current(dp)
+    updates = [make_update(i, user_id, text) for i in range(iterations)]
+    for update in updates[:200]:
+        await dp.process_update(update)
+    started = time.perf_counter()
+    for update in updates:
+        await dp.process_update(update)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+async def main(iterations=20000):
+    before, after = build_before(), build_after()
+    print(f"{'Stsenariy':<30} {'oldin, µs':>10} {'keyin, µs':>10} {'tezlashish':>11}")
+    for name, user_id, text in SCENARIOS:
+        old = await measure(before, user_id, text, iterations)
+        new = await measure(after, user_id, text, iterations)
+        print(f"{name:<30} {old:>10.1f} {new:>10.1f} {old / new:>10.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,37 +1,66 @@
 import logging
 import logging
-import aiofiles
 import os
 import asyncio
+import csv
+import inspect
+import io
+import re
 from aiogram import Bot, Dispatcher, types
 from aiogram.utils import executor
+from aiogram.bot.api import TelegramAPIServer, TELEGRAM_PRODUCTION
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 from logging.handlers import RotatingFileHandler
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
-from config import BOT_TOKEN, ADMIN_IDS, DB_NAME
+from fsm_storage import SQLiteStorage
+from config import (BOT_TOKEN, ADMIN_IDS, DB_NAME, SUBSCRIPTION_CACHE_TTL, SUBSCRIPTION_NEGATIVE_TTL, SUBSCRIPTION_CACHE_SIZE,
+                    CHANNEL_MEMBER_MAX_AGE, BOT_MODE, ALBUM_COLLECT_DELAY, LOCAL_BOT_API_URL)
+from cache import TTLCache
+from broadcast import notify_new_job, run_jobs
+from export import export_to_file
+import export
+import analytics
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters import Command
-from database import add_user, get_user_count, get_all_users, add_file, get_file, add_channel, remove_channel, get_channels, is_file_code_exists, remove_file, add_file_request, get_user_requests, get_all_file_codes
-import pandas as pd
+from aiogram.dispatcher.handler import SkipHandler
+from async_database import add_user, get_user, get_user_count, get_active_user_count, add_file, add_files_bulk, add_file_group, get_file, add_channel, remove_channel, get_channels, is_file_code_exists, remove_file, add_file_request, get_user_request_stats, get_file_codes_page, count_files, set_channel_member, get_channel_members, clear_channel_members
 from aiogram.dispatcher.filters.state import State, StatesGroup
 from datetime import datetime, timedelta
-from database import DB_NAME
+from database import DB_NAME, file_cache, to_epoch
+import time
 import sys
-import sqlite3
+import async_database
 
 import logging
 
 # Botni ishga tushirish
 
+# Lokal yuklama testi (LOCAL_BOT_API_URL aniq berilgan): javoblar va obuna tekshiruvlari soxta API'ga
+# ketadi, shunda test ishlab turgan botni Telegram limitlariga urib qo'ymaydi
+api_server = TELEGRAM_PRODUCTION
+if LOCAL_BOT_API_URL:
+    api_server = TelegramAPIServer.from_base(LOCAL_BOT_API_URL)
+
 try:
-    bot = Bot(token=BOT_TOKEN, parse_mode="HTML")  # HTML formatlashni standart qilish
+    bot = Bot(token=BOT_TOKEN, parse_mode="HTML", server=api_server)  # HTML formatlashni standart qilish
 except Exception as e:
     exit(1)
 
-dp = Dispatcher(bot, storage=MemoryStorage())
+# FSM holatlari bazada saqlanadi — qayta ishga tushganda admin jarayonlari yo'qolmaydi
+storage = SQLiteStorage()
+dp = Dispatcher(bot, storage=storage)
 
 # Adminlarni tekshirish uchun
-ADMINS = ADMIN_IDS
+ADMINS = frozenset(ADMIN_IDS)
+
+# Admin klaviaturasi tugmalari: matn -> (handler, state argumentini oladimi, istalgan holatda ishlaydimi)
+ADMIN_BUTTONS = {}
+
+def admin_button(text, any_state=False):
+    """Handlerni admin tugmasi sifatida ro'yxatga oladi (dispatcher'ga alohida filtr qo'shilmaydi)."""
+    def decorator(handler):
+        ADMIN_BUTTONS[text] = (handler, "state" in inspect.signature(handler).parameters, any_state)
+        return handler
+    return decorator
 
 log_file = "bot.log"
 max_log_size = 5 * 1024 * 1024  # 5 MB
@@ -58,12 +87,15 @@ admin_keyboard.add(
     KeyboardButton("📊 Statistika"),
     KeyboardButton("📥 Excelni yuklash"),
     KeyboardButton("📤 Fayl yuklash"),
+    KeyboardButton("📦 Ommaviy yuklash"),
     KeyboardButton("🗑 Fayl o‘chirish"),
     KeyboardButton("📢 Reklama"),
     KeyboardButton("🔗 Majburiy obuna"),
     KeyboardButton("👤 Foydalanuvchi statistikasi"),
     KeyboardButton("📈 Umumiy statistika"),
-    KeyboardButton("📋 Fayl kodlari ro‘yxati")
+    KeyboardButton("📋 Fayl kodlari ro‘yxati"),
+    KeyboardButton("🔥 Top fayllar"),
+    KeyboardButton("📉 Faollik tahlili")
 )
 
 reklama_keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
@@ -93,6 +125,9 @@ class FileUploadStates(StatesGroup):
     waiting_for_code = State()
     waiting_for_file = State()
 
+class BulkUploadStates(StatesGroup):
+    waiting_for_files = State()
+
 class UserStatsStates(StatesGroup):
     waiting_for_user_id = State()
     waiting_for_filter_start = State()
@@ -118,24 +153,126 @@ class MajburiyObunaStates(StatesGroup):
     waiting_for_channel_username = State()
     waiting_for_channel_remove = State()
 
+# Obuna holati keshi: (user_id, kanal) -> a'zo yoki yo'q
+subscription_cache = TTLCache(SUBSCRIPTION_CACHE_SIZE)
+
+# Kanal a'zolari indeksi: (kanal, user_id) -> (a'zo yoki yo'q, yozilgan vaqt).
+# Faqat bot admin bo'lgan (chat_member yangilanishlari keladigan) kanallar uchun to'ldiriladi.
+# Bot o'chiq paytdagi yangilanishlar tashlab yuboriladi, shuning uchun CHANNEL_MEMBER_MAX_AGE
+# dan eski yozuv noma'lum hisoblanadi va qayta tekshiriladi.
+channel_members = {}
+member_event_channels = set()
+
+async def find_channel(username):
+    """Telegram chat username'iga mos saqlangan kanal nomini qaytaradi."""
+    if not username:
+        return None
+    for channel in await get_channels():
+        if channel.lower() == username.lower():
+            return channel
+    return None
+
+async def remember_member(channel, user_id, is_member):
+    """A'zolik holatini indeksga va bazaga yozadi."""
+    channel_members[(channel, user_id)] = (is_member, time.time())
+    await set_channel_member(channel, user_id, is_member)
+
+def forget_channel_members(channel):
+    """Kanal kuzatuvdan chiqarilganda uning indeksini tozalaydi."""
+    member_event_channels.discard(channel)
+    for key in [key for key in channel_members if key[0] == channel]:
+        del channel_members[key]
+
+async def refresh_member_events(channel):
+    """Bot kanalda admin ekanini tekshiradi va kuzatiladigan kanallar ro'yxatini yangilaydi."""
+    try:
+        bot_member = await bot.get_chat_member(f"@{channel}", bot.id)
+    except Exception as e:
+        logger.warning(f"@{channel} kanalida bot holatini aniqlab bo'lmadi: {e}")
+        return
+    if bot_member.status in ["administrator", "creator"]:
+        member_event_channels.add(channel)
+    else:
+        forget_channel_members(channel)
+        await clear_channel_members(channel)
+
+async def load_channel_members():
+    """Saqlangan a'zolik indeksini yuklaydi va kuzatiladigan kanallarni aniqlaydi."""
+    channel_members.clear()
+    for channel, user_id, is_member, updated_at in await get_channel_members():
+        channel_members[(channel, user_id)] = (bool(is_member), to_epoch(updated_at) if updated_at else 0)
+    for channel in await get_channels():
+        await refresh_member_events(channel)
+    logger.info(f"A'zolik indeksi yuklandi: {len(channel_members)} yozuv, {len(member_event_channels)} ta kuzatiladigan kanal")
+
+async def is_channel_member(channel, user_id):
+    """Bitta kanal uchun a'zolikni Telegram API orqali tekshiradi va keshga yozadi."""
+    try:
+        chat_member = await bot.get_chat_member(f"@{channel}", user_id)
+        is_member = chat_member.status not in ["left", "kicked"]
+    except Exception as e:
+        # Natija noma'lum: faqat shu so'rov uchun rad etiladi, keshga yozilmaydi
+        logger.error(f"Obuna tekshiruvida xato: {e}")
+        return False
+    # Kuzatiladigan kanalda keyingi o'zgarishlar chat_member orqali keladi
+    if channel in member_event_channels:
+        await remember_member(channel, user_id, is_member)
+    ttl = SUBSCRIPTION_CACHE_TTL if is_member else SUBSCRIPTION_NEGATIVE_TTL
+    subscription_cache.set((user_id, channel), is_member, ttl)
+    return is_member
+
 # Obunani tekshirish funksiyasi
-async def check_subscription(user_id):
+async def check_subscription(user_id, force=False):
     if user_id in ADMINS:
         return True
-    channels = get_channels()
+    channels = await get_channels()
+    pending = []
+    fresh_after = time.time() - CHANNEL_MEMBER_MAX_AGE
     for channel in channels:
-        try:
-            chat_member = await bot.get_chat_member(f"@{channel}", user_id)
-            if chat_member.status in ["left", "kicked"]:
-                return False
-        except Exception as e:
-            logger.error(f"Obuna tekshiruvida xato: {e}")
+        if force:
+            pending.append(channel)
+            continue
+        indexed = channel_members.get((channel, user_id)) if channel in member_event_channels else None
+        if indexed is not None and indexed[1] >= fresh_after:
+            known = indexed[0]
+        else:
+            known = subscription_cache.get((user_id, channel))
+        if known is False:
             return False
-    return True
+        if known is None:
+            pending.append(channel)
+    if not pending:
+        return True
+    # Keshda yo'q kanallarni parallel tekshirish
+    results = await asyncio.gather(*[is_channel_member(channel, user_id) for channel in pending])
+    return all(results)
+
+# Kanal a'zoligi o'zgarishlari (bot kanalda admin bo'lsa keladi)
+@dp.chat_member_handler()
+async def chat_member_update(update: types.ChatMemberUpdated):
+    channel = await find_channel(update.chat.username)
+    if channel is None or channel not in member_event_channels:
+        return
+    user_id = update.new_chat_member.user.id
+    is_member = update.new_chat_member.status not in ["left", "kicked"]
+    await remember_member(channel, user_id, is_member)
+    subscription_cache.invalidate((user_id, channel))
+
+# Botning o'z huquqlari o'zgarganda
+@dp.my_chat_member_handler()
+async def my_chat_member_update(update: types.ChatMemberUpdated):
+    channel = await find_channel(update.chat.username)
+    if channel is None:
+        return
+    if update.new_chat_member.status in ["administrator", "creator"]:
+        member_event_channels.add(channel)
+    else:
+        forget_channel_members(channel)
+        await clear_channel_members(channel)
 
 # Obuna talab qilish funksiyasi
 async def prompt_subscription(message):
-    channels = get_channels()
+    channels = await get_channels()
     keyboard = InlineKeyboardMarkup(row_width=1)
     for channel in channels:
         keyboard.add(InlineKeyboardButton(text=f"📢 @{channel} ga obuna bo‘ling", url=f"https://t.me/{channel}"))
@@ -152,6 +289,12 @@ async def prompt_subscription(message):
 @dp.message_handler(Command("cancel"), state="*")
 async def cancel_handler(message: types.Message, state: FSMContext):
     if message.from_user.id in ADMINS:
+        # Yig'ilayotgan albom va ommaviy yuklash fayllari ham bekor qilinadi
+        task = album_tasks.pop(message.from_user.id, None)
+        if task is not None:
+            task.cancel()
+        album_uploads.pop(message.from_user.id, None)
+        bulk_uploads.pop(message.from_user.id, None)
         await state.finish()
         await message.answer("🚫 Bekor qilindi. Siz bosh menyudasiz.", reply_markup=admin_keyboard)
     else:
@@ -162,7 +305,7 @@ async def cancel_handler(message: types.Message, state: FSMContext):
 async def start_handler(message: types.Message):
     user = message.from_user
     logger.info(f"Foydalanuvchi {user.id} start bosdi.")
-    add_user(user.id, user.first_name, user.last_name, user.username)
+    await add_user(user.id, user.first_name, user.last_name, user.username)
 
     if not await check_subscription(user.id):
         await prompt_subscription(message)
@@ -205,7 +348,7 @@ async def check_subscription_callback(callback: types.CallbackQuery):
         "uz": "❌ Hali barcha kanallarga obuna bo‘lmagansiz.",
         "ru": "❌ Вы еще не подписались на все каналы."
     }
-    if await check_subscription(callback.from_user.id):
+    if await check_subscription(callback.from_user.id, force=True):
         await callback.message.delete()
         await callback.message.answer("✅ Obuna tekshirildi! Fayl kodini kiriting:")
     else:
@@ -229,6 +372,36 @@ async def send_file_by_type(chat_id, file_id, file_type, caption):
     else:
         await bot.send_message(chat_id, "❌ Noto‘g‘ri fayl turi!")
 
+# Albomda ko'pi bilan 10 ta fayl bo'ladi; rasm va video birga, hujjat va audio esa faqat o'z turi bilan
+MEDIA_GROUP_LIMIT = 10
+INPUT_MEDIA = {
+    "photo": types.InputMediaPhoto,
+    "video": types.InputMediaVideo,
+    "document": types.InputMediaDocument,
+    "audio": types.InputMediaAudio
+}
+MEDIA_GROUP_KINDS = {"photo": "visual", "video": "visual", "document": "document", "audio": "audio"}
+
+async def send_file_group(chat_id, items, caption):
+    """Kod fayllarini send_media_group bilan 10 tadan yuboradi; albomga sig'maydigan turlar alohida."""
+    chunks = []
+    for item in items:
+        kind = MEDIA_GROUP_KINDS.get(item[1])
+        if kind is not None and chunks and chunks[-1][0] == kind and len(chunks[-1][1]) < MEDIA_GROUP_LIMIT:
+            chunks[-1][1].append(item)
+        else:
+            chunks.append((kind, [item]))
+    for index, (kind, chunk) in enumerate(chunks):
+        # Umumiy izoh birinchi xabarga, agar faylning o'z izohi bo'lmasa
+        first_caption = chunk[0][2] or (caption if index == 0 else None)
+        if kind is None or len(chunk) == 1:
+            file_id, file_type, _ = chunk[0]
+            await send_file_by_type(chat_id, file_id, file_type, first_caption)
+            continue
+        media = [INPUT_MEDIA[file_type](file_id, caption=item_caption) for file_id, file_type, item_caption in chunk]
+        media[0].caption = first_caption
+        await bot.send_media_group(chat_id, media)
+
 
 
 @dp.message_handler(lambda message: message.text.isdigit(), state=None)
@@ -239,15 +412,17 @@ async def get_file_by_code(message: types.Message):
         return
 
     file_code = message.text.strip()
-    file_data = get_file(file_code)
+    file_data = await get_file(file_code)
     
     # So‘rovni log qilish
     if file_data:
-        add_file_request(user_id, file_code)
+        await add_file_request(user_id, file_code)
     
     if file_data:
-        file_id, file_link, file_type, caption = file_data
-        if file_id:
+        file_id, file_link, file_type, caption, items = file_data
+        if items:
+            await send_file_group(message.chat.id, items, caption or f"📥 '{file_code}' kodi uchun fayllar")
+        elif file_id:
             await send_file_by_type(message.chat.id, file_id, file_type, caption or f"📥 '{file_code}' kodi uchun fayl")
         elif file_link:
             await message.answer(f"📥 '{file_code}' kodi uchun havola:\n{file_link}")
@@ -256,68 +431,171 @@ async def get_file_by_code(message: types.Message):
     else:
         await message.answer("❌ Bunday kod bilan fayl topilmadi.")
 
+# Barcha admin tugmalari uchun yagona handler: bitta lug'at va frozenset tekshiruvi
+@dp.message_handler(lambda message: message.text in ADMIN_BUTTONS and message.from_user.id in ADMINS, state="*")
+async def route_admin_button(message: types.Message, state: FSMContext):
+    handler, wants_state, any_state = ADMIN_BUTTONS[message.text]
+    if not any_state and await state.get_state() is not None:
+        # Holat kutayotgan handlerlar matnni o'zi qayta ishlasin
+        raise SkipHandler()
+    if wants_state:
+        await handler(message, state)
+    else:
+        await handler(message)
+
 
-@dp.message_handler(lambda message: message.text == "📈 Umumiy statistika")
+@admin_button("📈 Umumiy statistika")
 async def export_all_users_stats(message: types.Message):
-    if message.from_user.id not in ADMINS:
+    await message.answer("📈 Statistika qaysi formatda kerak?", reply_markup=export_format_keyboard("stats"))
+
+@admin_button("📉 Faollik tahlili")
+async def export_analytics(message: types.Message):
+    await message.answer(
+        "📉 DAU, yangi/qaytgan foydalanuvchilar va haftalik retention hisoboti qaysi formatda kerak?",
+        reply_markup=export_format_keyboard("analytics")
+    )
+
+# Eksport formatini tanlash tugmalari
+def export_format_keyboard(kind):
+    keyboard = InlineKeyboardMarkup(row_width=2)
+    keyboard.add(
+        InlineKeyboardButton("📊 Excel", callback_data=f"dump_{kind}_xlsx"),
+        InlineKeyboardButton("⚡ CSV (tezroq)", callback_data=f"dump_{kind}_csv")
+    )
+    return keyboard
+
+EXPORT_CAPTIONS = {
+    "users": "📥 Foydalanuvchilar ro‘yxati",
+    "stats": "📈 Barcha foydalanuvchilar statistikasi",
+    "analytics": "📉 Faollik tahlili: DAU va retention kogortalari",
+}
+
+# Eksport alohida jarayonda tayyorlanadi, bot boshqa foydalanuvchilar uchun ishlashda davom etadi
+@dp.callback_query_handler(lambda c: c.data.startswith("dump_"))
+async def export_users_file(callback: types.CallbackQuery):
+    if callback.from_user.id not in ADMINS:
         return
-    
+    _, kind, fmt = callback.data.split("_")
+    await callback.answer("⏳ Fayl tayyorlanmoqda...")
+    path = None
     try:
-        with sqlite3.connect(DB_NAME) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT user_id, first_name, last_name, username, created_at FROM users")
-            users = cursor.fetchall()
-            cursor.execute("SELECT user_id, COUNT(*) FROM file_requests GROUP BY user_id")
-            request_counts = dict(cursor.fetchall())
-        
-        data = {
-            "Foydalanuvchi ID": [],
-            "Ism": [],
-            "Username": [],
-            "Ro‘yxatdan o‘tgan": [],
-            "So‘rovlar soni": []
-        }
-        for user in users:
-            user_id, first_name, last_name, username, created_at = user
-            data["Foydalanuvchi ID"].append(user_id)
-            data["Ism"].append(f"{first_name} {last_name or ''}")
-            data["Username"].append(f"@{username or 'Yo‘q'}")
-            data["Ro‘yxatdan o‘tgan"].append(created_at)
-            data["So‘rovlar soni"].append(request_counts.get(user_id, 0))
-        
-        df = pd.DataFrame(data)
-        file_name = "all_users_stats.xlsx"
-        df.to_excel(file_name, index=False)
-        
-        with open(file_name, "rb") as file:
-            await message.answer_document(file, caption="📈 Barcha foydalanuvchilar statistikasi")
-        os.remove(file_name)
+        if kind == "analytics":
+            path, file_name = await export.run_in_worker(analytics.build_report, fmt)
+        else:
+            path, file_name = await export_to_file(kind, fmt)
+        await callback.message.answer_document(types.InputFile(path, filename=file_name), caption=EXPORT_CAPTIONS[kind])
     except Exception as e:
-        logger.error(f"Umumiy statistika eksportida xatolik: {e}")
-        await message.answer("❌ Statistika eksport qilishda xatolik yuz berdi!")
+        logger.error(f"Eksportda xatolik ({kind}, {fmt}): {e}")
+        await callback.message.answer("❌ Statistika eksport qilishda xatolik yuz berdi!")
+    finally:
+        if path:
+            os.remove(path)
 
 # Admin funksiyalari
-@dp.message_handler(lambda message: message.text == "📊 Statistika")
+@admin_button("📊 Statistika")
 async def show_stats(message: types.Message):
-    if message.from_user.id not in ADMINS:
+    user_count = await get_user_count()
+    active_count = await get_active_user_count()
+    requests = await async_database.get_request_totals()
+    daily = requests["daily"]
+    today = daily[0][1] if daily and daily[0][0] == datetime.now().strftime("%Y-%m-%d") else 0
+    cache_stats = subscription_cache.stats()
+    file_stats = file_cache.stats()
+    fsm_stats = storage.stats()
+    queue_stats = async_database.write_queue_stats()
+    queue_lines = "\n".join(
+        f"📝 {name} navbati: {q['depth']} kutmoqda (maks. {q['max_depth']}), "
+        f"{q['rows_written']} yozildi, oxirgi yozish {q['last_flush_latency'] * 1000:.0f} ms "
+        f"(maks. {q['max_flush_latency'] * 1000:.0f} ms)"
+        for name, q in queue_stats.items()
+    )
+    await message.answer(
+        f"📊 Botdagi umumiy foydalanuvchilar soni: {user_count} ta (faol: {active_count} ta)\n"
+        f"📥 Fayl so‘rovlari: jami {requests['total']} ta, bugun {today} ta, "
+        f"oxirgi 7 kunda {sum(count for _, count in daily)} ta\n"
+        f"🔐 Obuna keshi: {cache_stats['hits']} hit / {cache_stats['misses']} miss "
+        f"({cache_stats['hit_ratio']:.0%}), {cache_stats['size']} yozuv\n"
+        f"📦 Fayl keshi: {file_stats['hits']} hit / {file_stats['misses']} miss "
+        f"({file_stats['hit_ratio']:.0%}), {file_stats['size']} yozuv, {file_stats['evictions']} chiqarildi\n"
+        f"🧭 FSM: {fsm_stats['active']} faol holat, kesh {fsm_stats['size']} yozuv "
+        f"({fsm_stats['hit_ratio']:.0%} hit)\n"
+        f"{queue_lines}"
+    )
+
+# Top fayllar hisoboti (soatlik yig'madan)
+TOP_PERIOD_NAMES = {"hour": "oxirgi soat", "day": "oxirgi kun", "week": "oxirgi hafta"}
+
+def top_periods_keyboard():
+    keyboard = InlineKeyboardMarkup(row_width=3)
+    keyboard.add(*[InlineKeyboardButton(f"🕐 {name.capitalize()}", callback_data=f"top_{period}")
+                   for period, name in TOP_PERIOD_NAMES.items()])
+    return keyboard
+
+@admin_button("🔥 Top fayllar")
+async def top_files(message: types.Message):
+    await message.answer("🔥 Qaysi davr uchun top fayllar kerak?", reply_markup=top_periods_keyboard())
+
+@dp.callback_query_handler(lambda c: c.data.startswith("top_"))
+async def show_top_files(callback: types.CallbackQuery):
+    if callback.from_user.id not in ADMINS:
+        return
+    period = callback.data[len("top_"):]
+    rows = await async_database.get_top_codes(period)
+    await callback.answer()
+    if not rows:
+        await callback.message.answer(f"📭 {TOP_PERIOD_NAMES[period].capitalize()} ichida so‘rovlar yo‘q.")
+        return
+    text = f"🔥 <b>Top {len(rows)} fayl ({TOP_PERIOD_NAMES[period]}):</b>\n"
+    text += "\n".join(f"{i}. <code>{code}</code> — {count} ta so‘rov" for i, (code, count) in enumerate(rows, 1))
+    keyboard = InlineKeyboardMarkup(row_width=5)
+    keyboard.add(*[InlineKeyboardButton(f"📊 {code}", callback_data=f"hist_{code}") for code, _ in rows])
+    await callback.message.answer(text + "\n\n📊 Soatlik grafik uchun kodni tanlang:", reply_markup=keyboard)
+
+@dp.callback_query_handler(lambda c: c.data.startswith("hist_"))
+async def show_code_histogram(callback: types.CallbackQuery):
+    if callback.from_user.id not in ADMINS:
         return
-    user_count = get_user_count()
-    await message.answer(f"📊 Botdagi umumiy foydalanuvchilar soni: {user_count} ta")
+    file_code = callback.data[len("hist_"):]
+    histogram = await async_database.get_code_histogram(file_code)
+    await callback.answer()
+    peak = max(count for _, count in histogram) or 1
+    lines = [
+        f"{datetime.fromtimestamp(hour_ts).strftime('%H:00')} {'█' * round(count * 20 / peak):<20} {count}"
+        for hour_ts, count in histogram
+    ]
+    await callback.message.answer(
+        f"📊 <b>'{file_code}' kodi — oxirgi 24 soat:</b>\n<pre>" + "\n".join(lines) + "</pre>",
+        parse_mode="HTML"
+    )
 
-@dp.message_handler(lambda message: message.text == "📥 Excelni yuklash")
-async def download_excel(message: types.Message):
+# Yig'ma statistikani xom jadvallardan qayta hisoblash (moslikni tekshirish uchun)
+@dp.message_handler(commands=['rebuild_stats'])
+async def rebuild_stats(message: types.Message):
     if message.from_user.id not in ADMINS:
         return
-    users = get_all_users()
-    df = pd.DataFrame(users, columns=["ID", "Telegram ID", "Ism", "Familiya", "Username", "Ro‘yxatdan o‘tgan vaqt"])
-    df.to_excel("users.xlsx", index=False)
-    with open("users.xlsx", "rb") as file:
-        await message.answer_document(file, caption="📥 Foydalanuvchilar ro‘yxati (Excel)")
-
-@dp.message_handler(lambda message: message.text == "📤 Fayl yuklash")
-async def request_file_code(message: types.Message):
+    await message.answer("⏳ Statistika qayta hisoblanmoqda...")
+    await async_database.file_request_queue.flush()
+    differences = await async_database.rebuild_rollups()
+    lines = "\n".join(f"• {table}: {count} ta farq" for table, count in differences.items())
+    await message.answer(f"✅ Statistika qayta hisoblandi.\n{lines}")
+
+# Eski bazani auto_vacuum = INCREMENTAL ga o'tkazish (bir martalik to'liq VACUUM, bu vaqtda yozishlar kutadi)
+@dp.message_handler(commands=['enable_vacuum'])
+async def enable_vacuum(message: types.Message):
     if message.from_user.id not in ADMINS:
         return
+    await message.answer("⏳ Baza qayta yozilmoqda (VACUUM), bu biroz vaqt olishi mumkin...")
+    if await async_database.enable_incremental_vacuum():
+        await message.answer("✅ Bo'sh joy endi bosqichma-bosqich qaytariladi (auto_vacuum = INCREMENTAL).")
+    else:
+        await message.answer("❌ Rejimni o'zgartirib bo'lmadi, bot.log ni tekshiring.")
+
+@admin_button("📥 Excelni yuklash")
+async def download_excel(message: types.Message):
+    await message.answer("📥 Foydalanuvchilar ro‘yxati qaysi formatda kerak?", reply_markup=export_format_keyboard("users"))
+
+@admin_button("📤 Fayl yuklash")
+async def request_file_code(message: types.Message):
     await message.answer("📥 Fayl kodini kiriting (faqat raqam) yoki bekor qilish uchun /cancel bosing:")
     await FileUploadStates.waiting_for_code.set()
 
@@ -344,10 +622,8 @@ def parse_date_input(user_input):
         except ValueError:
             return None, None  # Noto‘g‘ri format
 
-@dp.message_handler(lambda message: message.text == "👤 Foydalanuvchi statistikasi")
+@admin_button("👤 Foydalanuvchi statistikasi")
 async def request_user_stats(message: types.Message):
-    if message.from_user.id not in ADMINS:
-        return
     await message.answer("👤 Statistikasini ko‘rish uchun foydalanuvchi ID’sini kiriting yoki /cancel bosing:")
     await UserStatsStates.waiting_for_user_id.set()
 
@@ -360,14 +636,11 @@ async def process_user_stats(message: types.Message, state: FSMContext):
     
     user_id = int(user_id)
     await state.update_data(user_id=user_id)
-    with sqlite3.connect(DB_NAME) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT first_name, last_name, username, created_at FROM users WHERE user_id = ?", (user_id,))
-        user_data = cursor.fetchone()
-        if not user_data:
-            await message.answer(f"❌ ID: {user_id} bilan foydalanuvchi topilmadi!", reply_markup=admin_keyboard)
-            await state.finish()
-            return
+    user_data = await get_user(user_id)
+    if not user_data:
+        await message.answer(f"❌ ID: {user_id} bilan foydalanuvchi topilmadi!", reply_markup=admin_keyboard)
+        await state.finish()
+        return
     
     await message.answer(
         "📅 So‘rovlar uchun boshlanish vaqtini kiriting (YYYY-MM-DD HH:MM:SS formatida, masalan, 2025-03-10 00:00:00) yoki 'barchasi' deb yozing\n yoki /cancel bosing:"
@@ -404,17 +677,13 @@ async def process_filter_end(message: types.Message, state: FSMContext):
         await message.answer("❌ Noto‘g‘ri format! 'bugun', 'kecha', 'hafta', 'barchasi' yoki YYYY-MM-DD HH:MM:SS kiriting\n yoki /cancel bosing:")
         return
     
-    with sqlite3.connect(DB_NAME) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT first_name, last_name, username, created_at FROM users WHERE user_id = ?", (user_id,))
-        user_data = cursor.fetchone()
-        if not user_data:
-            await message.answer(f"❌ ID: {user_id} bilan foydalanuvchi topilmadi!", reply_markup=admin_keyboard)
-            await state.finish()
-            return
-        first_name, last_name, username, created_at = user_data
-        requests = get_user_requests(user_id, start_date, end_date)
-        request_count = len(requests)
+    user_data = await get_user(user_id)
+    if not user_data:
+        await message.answer(f"❌ ID: {user_id} bilan foydalanuvchi topilmadi!", reply_markup=admin_keyboard)
+        await state.finish()
+        return
+    first_name, last_name, username, created_at = user_data
+    stats = await get_user_request_stats(user_id, start_date, end_date)
     
     response = (
         f"👤 Foydalanuvchi statistikasi:\n"
@@ -422,10 +691,11 @@ async def process_filter_end(message: types.Message, state: FSMContext):
         f"Ism: {first_name} {last_name or ''}\n"
         f"Username: @{username or 'Yo‘q'}\n"
         f"Ro‘yxatdan o‘tgan: {created_at}\n"
-        f"So‘rovlar soni: {request_count}\n"
+        f"So‘rovlar soni: {stats['count']}\n"
     )
-    if requests:
-        response += "So‘nggi so‘rovlar:\n" + "\n".join([f"- Kod: {req[0]}, Vaqt: {req[1]}" for req in requests[:5]])
+    if stats["count"]:
+        response += "So‘nggi so‘rovlar:\n" + "\n".join([f"- Kod: {code}, Vaqt: {requested_at}" for code, requested_at in stats["recent"]])
+        response += "\nKo‘p so‘ralgan kodlar:\n" + "\n".join([f"- Kod: {code}: {count} marta" for code, count in stats["by_code"]])
     else:
         response += "So‘rovlar: Yo‘q"
 
@@ -442,50 +712,39 @@ async def export_user_stats(callback: types.CallbackQuery):
     start_date = parts[3] if parts[3] != "all" else None
     end_date = parts[4] if parts[4] != "all" else None
     
-    with sqlite3.connect(DB_NAME) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT first_name, last_name, username, created_at FROM users WHERE user_id = ?", (user_id,))
-        user_data = cursor.fetchone()
-        if not user_data:
-            await callback.message.answer("❌ Foydalanuvchi topilmadi!")
-            return
-        first_name, last_name, username, created_at = user_data
-        requests = get_user_requests(user_id, start_date, end_date)
-    
-    data = {
-        "Foydalanuvchi ID": [user_id],
-        "Ism": [f"{first_name} {last_name or ''}"],
-        "Username": [f"@{username or 'Yo‘q'}"],
-        "Ro‘yxatdan o‘tgan": [created_at],
-        "So‘rovlar soni": [len(requests)]
-    }
-    if requests:
-        data["So‘rov kodi"] = [req[0] for req in requests]
-        data["So‘rov vaqti"] = [req[1] for req in requests]
-    df = pd.DataFrame(data)
-    file_name = f"user_stats_{user_id}.xlsx"
-    df.to_excel(file_name, index=False)
-    
-    with open(file_name, "rb") as file:
-        await callback.message.answer_document(file, caption=f"📊 Foydalanuvchi {user_id} statistikasi (Filtr: {start_date or 'barchasi'} - {end_date or 'barchasi'})")
-    os.remove(file_name)
-    await callback.answer()
+    user_data = await get_user(user_id)
+    if not user_data:
+        await callback.message.answer("❌ Foydalanuvchi topilmadi!")
+        return
+    first_name, last_name, username, created_at = user_data
+    await callback.answer("⏳ Fayl tayyorlanmoqda...")
+    stats = await get_user_request_stats(user_id, start_date, end_date)
+    path = None
+    try:
+        # So‘rovlar qatorlari faqat shu yerda, alohida jarayonda o‘qiladi
+        path, file_name = await export_to_file("requests", "xlsx", (user_id, start_date, end_date))
+        await callback.message.answer_document(
+            types.InputFile(path, filename=f"user_stats_{user_id}.xlsx"),
+            caption=(
+                f"📊 Foydalanuvchi {user_id} statistikasi (Filtr: {start_date or 'barchasi'} - {end_date or 'barchasi'})\n"
+                f"Ism: {first_name} {last_name or ''}, @{username or 'Yo‘q'}, ro‘yxatdan o‘tgan: {created_at}\n"
+                f"So‘rovlar soni: {stats['count']}"
+            )
+        )
+    except Exception as e:
+        logger.error(f"Foydalanuvchi statistikasi eksportida xatolik: {e}")
+        await callback.message.answer("❌ Statistika eksport qilishda xatolik yuz berdi!")
+    finally:
+        if path:
+            os.remove(path)
 
-FILE_TYPES = ["document", "photo", "video", "audio", "animation", "voice", "sticker"]
+FILE_TYPES = ["document", "photo", "video", "audio", "animation", "voice", "sticker", "album"]
 
 ITEMS_PER_PAGE = 10
 
 # Fayl kodlari ro‘yxatini ko‘rsatish
-@dp.message_handler(lambda message: message.text == "📋 Fayl kodlari ro‘yxati")
+@admin_button("📋 Fayl kodlari ro‘yxati")
 async def list_file_codes(message: types.Message):
-    if message.from_user.id not in ADMINS:
-        await message.answer(
-            "<b>🚫 Xatolik!</b>\n"
-            "<i>Siz admin emassiz. Bu funksiya faqat adminlar uchun!</i>",
-            parse_mode="HTML"
-        )
-        return
-    
     # Fayl turlari va ularga mos emojilar
     file_type_emojis = {
         "all": "📦",
@@ -495,7 +754,8 @@ async def list_file_codes(message: types.Message):
         "audio": "🎵",
         "animation": "🎞️",
         "voice": "🎤",
-        "sticker": "💟"
+        "sticker": "💟",
+        "album": "🗂"
     }
 
     filter_keyboard = InlineKeyboardMarkup(row_width=2)
@@ -519,8 +779,7 @@ async def process_file_filter(callback: types.CallbackQuery, state: FSMContext):
     filter_type = callback.data.split("_")[1]
     file_type = None if filter_type == "all" else filter_type
     
-    file_codes = get_all_file_codes(file_type=file_type)
-    if not file_codes:
+    if not await count_files(file_type):
         await callback.message.delete()
         await callback.message.answer(
             "<b>🚫 Hech narsa topilmadi!</b>\n"
@@ -533,40 +792,27 @@ async def process_file_filter(callback: types.CallbackQuery, state: FSMContext):
         return
     
     # Birinchi sahifani ko‘rsatish
-    await state.update_data(file_codes=file_codes, file_type=file_type, current_page=0)
-    await show_file_page(callback.message, state, 0)
-    
-    await FileListStates.listing_files.set()
-    await callback.answer()
-    
-    # Birinchi sahifani ko‘rsatish
-    await state.update_data(file_codes=file_codes, file_type=file_type, current_page=0)
-    await show_file_page(callback.message, state, 0)
+    await show_file_page(callback.message, file_type, 0)
     
     await FileListStates.listing_files.set()
     await callback.answer()
 
-# Sahifani ko‘rsatish funksiyasi
-async def show_file_page(message: types.Message, state: FSMContext, page: int):
-    data = await state.get_data()
-    file_codes = data["file_codes"]
-    file_type = data["file_type"]
+# Sahifani ko‘rsatish funksiyasi.
+# Ro‘yxat xotirada saqlanmaydi: har bir sahifa (uploaded_ts, id) kursori bo‘yicha bazadan olinadi,
+# kursor va filtr esa tugmalarning callback_data sida turadi.
+async def show_file_page(message: types.Message, file_type, page: int, cursor=None, backward=False):
+    total_items = await count_files(file_type)
+    total_pages = max((total_items + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE, 1)
     
-    total_items = len(file_codes)
-    total_pages = (total_items + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
-    
-    if page < 0 or page >= total_pages:
+    page_items = await get_file_codes_page(file_type, cursor, backward, ITEMS_PER_PAGE)
+    if not page_items:
         return
     
-    start_idx = page * ITEMS_PER_PAGE
-    end_idx = min(start_idx + ITEMS_PER_PAGE, total_items)
-    page_items = file_codes[start_idx:end_idx]
-    
     response = (
         f"<b>📋 Fayl Kodlari Ro‘yxati</b> (<u>{'Barchasi' if not file_type else file_type.capitalize()}</u>)\n"
         "<i>Quyida mavjud fayllar ro‘yxati keltirilgan:</i>\n\n"
     )
-    for code, f_type, uploaded_at, caption in page_items:
+    for code, f_type, uploaded_at, caption, _, _ in page_items:
         caption_text = f" - <i>{caption}</i>" if caption else ""
         response += (
             f"🔹 <b>Kod:</b> <code>{code}</code> | <b>Tur:</b> {f_type} | "
@@ -576,21 +822,28 @@ async def show_file_page(message: types.Message, state: FSMContext, page: int):
     # Sahifa ma'lumoti
     response += f"\nSahifa: {page + 1}/{total_pages}"
     
-    # Navigatsiya tugmalari
+    # Navigatsiya tugmalari: fp_<tur>_<yo‘nalish>_<sahifa>_<uploaded_ts>_<id>
+    filter_type = file_type or "all"
+    first_ts, first_id = page_items[0][4:]
+    last_ts, last_id = page_items[-1][4:]
     nav_keyboard = InlineKeyboardMarkup()
     if page > 0:
-        nav_keyboard.add(InlineKeyboardButton("⏪ Oldingi", callback_data=f"page_{page-1}"))
-    if page < total_pages - 1:
-        nav_keyboard.insert(InlineKeyboardButton("Keyingi ⏩", callback_data=f"page_{page+1}"))
+        nav_keyboard.add(InlineKeyboardButton("⏪ Oldingi", callback_data=f"fp_{filter_type}_p_{page - 1}_{first_ts or 0}_{first_id}"))
+    if page < total_pages - 1 and len(page_items) == ITEMS_PER_PAGE:
+        nav_keyboard.insert(InlineKeyboardButton("Keyingi ⏩", callback_data=f"fp_{filter_type}_n_{page + 1}_{last_ts or 0}_{last_id}"))
     nav_keyboard.add(InlineKeyboardButton("🔙 Orqaga", callback_data="back_to_menu"))
     
     await message.edit_text(response, parse_mode="HTML", reply_markup=nav_keyboard)
 
 # Navigatsiya handler
-@dp.callback_query_handler(lambda c: c.data.startswith("page_"), state=FileListStates.listing_files)
+@dp.callback_query_handler(lambda c: c.data.startswith("fp_"), state=FileListStates.listing_files)
 async def process_page_navigation(callback: types.CallbackQuery, state: FSMContext):
-    page = int(callback.data.split("_")[1])
-    await show_file_page(callback.message, state, page)
+    _, filter_type, direction, page, uploaded_ts, file_id = callback.data.split("_")
+    file_type = None if filter_type == "all" else filter_type
+    await show_file_page(
+        callback.message, file_type, int(page),
+        cursor=(int(uploaded_ts), int(file_id)), backward=(direction == "p")
+    )
     await callback.answer()
 
 # Orqaga qaytish
@@ -603,10 +856,8 @@ async def back_to_admin_menu_from_list(callback: types.CallbackQuery, state: FSM
 
 
 
-@dp.message_handler(lambda message: message.text == "🗑 Fayl o‘chirish")
+@admin_button("🗑 Fayl o‘chirish")
 async def request_file_delete_code(message: types.Message):
-    if message.from_user.id not in ADMINS:
-        return
     await message.answer("🗑 O‘chirish uchun fayl kodini kiriting yoki bekor qilish uchun /cancel bosing:")
     await FileDeleteStates.waiting_for_code.set()
 
@@ -617,7 +868,7 @@ async def process_file_delete(message: types.Message, state: FSMContext):
         await message.answer("❌ Noto‘g‘ri format! Iltimos, faqat raqam kiriting.")
         return
     
-    success = remove_file(file_code)
+    success = await remove_file(file_code)
     if success:
         await message.answer(f"✅ '{file_code}' kodli fayl o‘chirildi!", reply_markup=admin_keyboard)
     else:
@@ -632,22 +883,21 @@ async def receive_file_code(message: types.Message, state: FSMContext):
         return
 
     file_code = message.text.strip()
-    if is_file_code_exists(file_code):
+    if await is_file_code_exists(file_code):
         await message.answer(f"❌ {file_code} kodi allaqachon mavjud! Iltimos, boshqa kod kiriting\nyoki bekor qilish uchun /cancel bosing: ")
         return
     
     await state.update_data(file_code=file_code)
-    await message.answer("📤 Endi faylni yuboring yoki bekor qilish uchun /cancel bosing:")
+    await message.answer("📤 Endi faylni yuboring (bir nechta fayl uchun — albom qilib) yoki bekor qilish uchun /cancel bosing:")
     await FileUploadStates.waiting_for_file.set()
 
-@dp.message_handler(content_types=[
+MEDIA_CONTENT_TYPES = [
     types.ContentType.DOCUMENT, types.ContentType.PHOTO, types.ContentType.VIDEO,
     types.ContentType.AUDIO, types.ContentType.ANIMATION, types.ContentType.VOICE,
-    types.ContentType.STICKER], state=FileUploadStates.waiting_for_file)
-async def receive_file(message: types.Message, state: FSMContext):
-    data = await state.get_data()
-    file_code = data.get("file_code")
-    
+    types.ContentType.STICKER]
+
+def extract_file(message: types.Message):
+    """Xabardagi media: (file_id, file_type) yoki None."""
     file_types = {
         "document": message.document,
         "photo": message.photo[-1] if message.photo else None,
@@ -657,18 +907,47 @@ async def receive_file(message: types.Message, state: FSMContext):
         "voice": message.voice,
         "sticker": message.sticker
     }
-    
     for f_type, f_obj in file_types.items():
         if f_obj:
-            file_id = f_obj.file_id
-            file_type = f_type
-            break
-    else:
+            return f_obj.file_id, f_type
+    return None
+
+# Albom qismlari: admin -> (media_group_id, [(message_id, file_id, file_type, caption), ...]).
+# Bitta kodga bitta albom; saqlash boshlangach ro'yxat o'rnida None turadi (kechikkan qismlar rad etiladi).
+album_uploads = {}
+# Albomni saqlashni kutayotgan vazifalar: admin -> asyncio.Task
+album_tasks = {}
+
+@dp.message_handler(content_types=MEDIA_CONTENT_TYPES, state=FileUploadStates.waiting_for_file)
+async def receive_file(message: types.Message, state: FSMContext):
+    data = await state.get_data()
+    file_code = data.get("file_code")
+    
+    media = extract_file(message)
+    if media is None:
         await message.answer("❌ Noto'g'ri format! Iltimos, faylni yuboring.")
         return
+    file_id, file_type = media
+
+    user_id = message.from_user.id
+    pending = album_uploads.get(user_id)
+    if pending is not None and (pending[0] != message.media_group_id or pending[1] is None):
+        logger.warning(f"Admin {user_id}: '{file_code}' kodi uchun albom allaqachon qabul qilingan, fayl rad etildi")
+        if pending[0] != message.media_group_id:
+            await message.answer("❌ Bitta kod uchun bitta albom yuboriladi. Oldingi albom saqlanmoqda.")
+        return
+    if message.media_group_id:
+        # Albom qismlari alohida xabarlar bo'lib keladi: oxirgisidan keyin bir marta saqlanadi
+        album_uploads.setdefault(user_id, (message.media_group_id, []))[1].append(
+            (message.message_id, file_id, file_type, message.caption))
+        task = album_tasks.pop(user_id, None)
+        if task is not None:
+            task.cancel()
+        album_tasks[user_id] = asyncio.create_task(save_album_upload(message, state, file_code))
+        return
     
     caption = message.caption if message.caption else None
-    success = add_file(file_code, file_id=file_id, file_type=file_type, caption=caption)
+    success = await add_file(file_code, file_id=file_id, file_type=file_type, caption=caption)
     
     if success:
         await message.answer(f"✅ Fayl '{file_code}' kodi bilan saqlandi.", reply_markup=admin_keyboard)
@@ -677,59 +956,160 @@ async def receive_file(message: types.Message, state: FSMContext):
     
     await state.finish()
 
+async def save_album_upload(message: types.Message, state: FSMContext, file_code):
+    await asyncio.sleep(ALBUM_COLLECT_DELAY)
+    user_id = message.from_user.id
+    album_tasks.pop(user_id, None)
+    group_id, parts = album_uploads[user_id]
+    album_uploads[user_id] = (group_id, None)
+    items = [item[1:] for item in sorted(parts)]
+    try:
+        if len(items) == 1:
+            file_id, file_type, caption = items[0]
+            success = await add_file(file_code, file_id=file_id, file_type=file_type, caption=caption)
+        else:
+            success = await add_file_group(file_code, items)
+        # Holat yopilgandan keyingina kechikkan qismlar endi bu handlerga tushmaydi
+        await state.finish()
+    finally:
+        album_uploads.pop(user_id, None)
+    if success:
+        await message.answer(f"✅ {len(items)} ta fayl '{file_code}' kodi bilan saqlandi.", reply_markup=admin_keyboard)
+    else:
+        await message.answer("❌ Fayl saqlashda xatolik yuz berdi!")
+
 @dp.message_handler(state=FileUploadStates.waiting_for_file)
 async def handle_wrong_input_file(message: types.Message):
     await message.answer("❌ Noto'g'ri format! Iltimos, faylni yuboring yoki /cancel bosing:")
 
+# Ommaviy yuklash: admin -> [(message_id, file_id, file_type, caption), ...].
+# Albom xabarlari parallel ishlanadi, shuning uchun ro'yxat FSM ma'lumotlarida emas, xotirada yig'iladi
+bulk_uploads = {}
+
+BULK_RANGE = re.compile(r"^(\d+)\s*-\s*(\d+)$")
+MESSAGE_LIMIT = 4000
+
+@admin_button("📦 Ommaviy yuklash")
+async def request_bulk_upload(message: types.Message):
+    bulk_uploads[message.from_user.id] = []
+    await message.answer(
+        "📦 Fayllarni yuboring: alohida, albom qilib yoki saqlash kanalidan forward qilib.\n"
+        "Hammasi yuborilgach, kodlarni bitta xabarda kiriting:\n"
+        "• oraliq: <code>100-149</code>\n"
+        "• boshlang‘ich kod: <code>100</code> (qolganlari ketma-ket beriladi)\n"
+        "• CSV: har bir qatorda <code>kod,izoh</code> fayllar tartibida (matn yoki .csv fayl)\n"
+        "Bekor qilish uchun /cancel bosing."
+    )
+    await BulkUploadStates.waiting_for_files.set()
+
+def parse_bulk_codes(text, count):
+    """Kodlar ro'yxati [(kod, izoh yoki None), ...]; format noto'g'ri bo'lsa None."""
+    text = text.strip()
+    match = BULK_RANGE.match(text)
+    if match:
+        first, last = int(match[1]), int(match[2])
+        if last < first:
+            return None
+        return [(str(code).zfill(len(match[1])), None) for code in range(first, last + 1)]
+    if text.isdigit():
+        return [(str(int(text) + i).zfill(len(text)), None) for i in range(count)]
+    rows = [[cell.strip() for cell in row] for row in csv.reader(io.StringIO(text)) if row and row[0].strip()]
+    if rows and not rows[0][0].isdigit():
+        rows = rows[1:]  # Sarlavha qatori
+    if not rows:
+        return None
+    return [(row[0], row[1] if len(row) > 1 and row[1] else None) for row in rows]
+
+@dp.message_handler(content_types=MEDIA_CONTENT_TYPES, state=BulkUploadStates.waiting_for_files)
+async def collect_bulk_file(message: types.Message, state: FSMContext):
+    if message.document and (message.document.file_name or "").lower().endswith(".csv"):
+        buffer = io.BytesIO()
+        await message.document.download(destination_file=buffer)
+        await process_bulk_codes(message, state, buffer.getvalue().decode("utf-8-sig", errors="replace"))
+        return
+    file_id, file_type = extract_file(message)
+    bulk_uploads.setdefault(message.from_user.id, []).append((message.message_id, file_id, file_type, message.caption))
+
+@dp.message_handler(content_types=types.ContentType.ANY, state=BulkUploadStates.waiting_for_files)
+async def receive_bulk_codes(message: types.Message, state: FSMContext):
+    await process_bulk_codes(message, state, message.text or "")
+
+async def process_bulk_codes(message: types.Message, state: FSMContext, text):
+    """Kodlarni fayllarga biriktiradi, hammasini bitta tranzaksiyada saqlaydi va bitta hisobot yuboradi."""
+    # Xabarlar yuborilgan tartibda (albomlar parallel kelgan bo'lishi mumkin)
+    items = sorted(bulk_uploads.get(message.from_user.id, []))
+    if not items:
+        await message.answer("❌ Hali birorta fayl yuborilmadi. Avval fayllarni yuboring yoki /cancel bosing:")
+        return
+    codes = parse_bulk_codes(text, len(items))
+    if codes is None:
+        await message.answer("❌ Noto‘g‘ri format! Oraliq (100-149), boshlang‘ich kod (100) yoki CSV kiriting\n"
+                             "yoki /cancel bosing:")
+        return
+
+    rows = []
+    results = []  # (kod, tur, xato yoki None)
+    seen = set()
+    for index, (_, file_id, file_type, caption) in enumerate(items):
+        if index >= len(codes):
+            results.append(("—", file_type, "kod yetmadi"))
+            continue
+        code, code_caption = codes[index]
+        if not code.isdigit():
+            results.append((code, file_type, "kod faqat raqam bo‘lishi kerak"))
+        elif code in seen:
+            results.append((code, file_type, "kod ro‘yxatda takrorlangan"))
+        else:
+            seen.add(code)
+            rows.append((code, file_id, file_type, code_caption or caption))
+            results.append((code, file_type, None))
+    existing = await add_files_bulk(rows) if rows else set()
+    results = [(code, file_type, "kod allaqachon mavjud" if error is None and code in existing else error)
+               for code, file_type, error in results]
+
+    saved = sum(1 for *_, error in results if error is None)
+    header = f"📦 Ommaviy yuklash: {saved} ta saqlandi, {len(results) - saved} ta xato."
+    if len(codes) > len(items):
+        header += f"\nℹ️ {len(codes) - len(items)} ta ortiqcha kod ishlatilmadi."
+    lines = [f"{i}. {code} ({file_type}) — {'✅' if error is None else '❌ ' + error}"
+             for i, (code, file_type, error) in enumerate(results, 1)]
+    report = header + "\n\n" + "\n".join(lines)
+    if len(report) <= MESSAGE_LIMIT:
+        await message.answer(report, reply_markup=admin_keyboard)
+    else:
+        # Uzun hisobot bitta fayl sifatida
+        document = types.InputFile(io.BytesIO("\n".join(lines).encode("utf-8")), filename="bulk_upload.txt")
+        await message.answer_document(document, caption=header, reply_markup=admin_keyboard)
+    bulk_uploads.pop(message.from_user.id, None)
+    await state.finish()
+
 # Reklama funksiyalari
-async def send_to_all(users, method, *args, content_type="unknown", **kwargs):
-    semaphore = asyncio.Semaphore(20)
-    batch_size = 1000  # Har bir partiyada 1000 foydalanuvchi
-
-    async def send_message_with_semaphore(user):
-        async with semaphore:
-            try:
-                await method(user[1], *args, **kwargs)
-            except Exception as e:
-                if "bot was blocked by the user" in str(e):
-                    logger.warning(f"Foydalanuvchi botni bloklagan: {user[1]}")
-                else:
-                    logger.error(f"Reklama yuborishda xatolik ({content_type}): {user[1]} - {e}")
-            await asyncio.sleep(0.05)
-
-    for i in range(0, len(users), batch_size):
-        batch = users[i:i + batch_size]
-        tasks = [send_message_with_semaphore(user) for user in batch]
-        await asyncio.gather(*tasks)
-        await asyncio.sleep(1)  # Har bir partiyadan keyin 1 soniya pauza
-
-@dp.message_handler(lambda message: message.text == "📢 Reklama")
+async def send_to_all(method, *args, content_type="unknown", admin_chat_id=None, **kwargs):
+    """Reklamani saqlanadigan vazifa sifatida navbatga qo'yadi va darhol qaytadi."""
+    job_id = await async_database.create_broadcast_job(content_type, method.__name__, args, kwargs, admin_chat_id)
+    notify_new_job()
+    return job_id
+
+@admin_button("📢 Reklama")
 async def reklama_menu(message: types.Message):
-    if message.from_user.id not in ADMINS:
-        return
     await message.answer("Reklama turini tanlang:", reply_markup=reklama_keyboard)
 
-@dp.message_handler(lambda message: message.text == "🔙 Orqaga", state="*")
+@admin_button("🔙 Orqaga", any_state=True)
 async def back_to_admin_menu(message: types.Message, state: FSMContext):
-    if message.from_user.id not in ADMINS:
-        return
     await state.finish()
     await message.answer("Admin panelga qaytdingiz.", reply_markup=admin_keyboard)
 
 # SMS reklama
-@dp.message_handler(lambda message: message.text == "📝 SMS")
+@admin_button("📝 SMS")
 async def request_sms_reklama(message: types.Message):
-    if message.from_user.id not in ADMINS:
-        return
     await message.answer("Reklama matnini kiriting yoki bekor qilish uchun /cancel bosing:")
     await ReklamaStates.waiting_for_sms.set()
 
 @dp.message_handler(content_types=types.ContentType.TEXT, state=ReklamaStates.waiting_for_sms)
 async def send_sms_reklama(message: types.Message, state: FSMContext):
     reklama_text = message.text
-    users = get_all_users()
-    await send_to_all(users, bot.send_message, reklama_text)
-    await message.answer("✅ SMS reklama barcha foydalanuvchilarga yuborildi!", reply_markup=admin_keyboard)
+    await send_to_all(bot.send_message, reklama_text, content_type="text", admin_chat_id=message.chat.id)
+    await message.answer("✅ SMS reklama navbatga qo‘shildi! Yuborish tugagach xabar beriladi.", reply_markup=admin_keyboard)
     await state.finish()
 
 @dp.message_handler(content_types=types.ContentType.ANY, state=ReklamaStates.waiting_for_sms)
@@ -737,40 +1117,29 @@ async def handle_wrong_input_sms(message: types.Message):
     await message.answer("❌ Faqat matn yuboring!")
 
 # Rasm reklama
-@dp.message_handler(lambda message: message.text == "🖼 Rasm")
+@admin_button("🖼 Rasm")
 async def request_photo_reklama(message: types.Message):
-    if message.from_user.id not in ADMINS:
-        return
     await message.answer("Rasmni yuboring (jpg/png) yoki bekor qilish uchun /cancel bosing:")
     await ReklamaStates.waiting_for_photo.set()
 
 @dp.message_handler(content_types=[types.ContentType.PHOTO, types.ContentType.DOCUMENT], state=ReklamaStates.waiting_for_photo)
 async def send_photo_reklama(message: types.Message, state: FSMContext):
-    users = get_all_users()
     caption = message.caption if message.caption else ""
     
     if message.photo:
         photo_id = message.photo[-1].file_id
-        await send_to_all(users, bot.send_photo, photo_id, content_type="photo", caption=caption)
-        await message.answer("✅ Rasm reklama barcha foydalanuvchilarga yuborildi!", reply_markup=admin_keyboard)
     elif message.document:
         file_name = message.document.file_name.lower()
-        if file_name.endswith(('.jpg', '.png')):
-            file_info = await bot.get_file(message.document.file_id)
-            file_path = file_info.file_path
-            downloaded_file = await bot.download_file(file_path)
-            file_bytes = downloaded_file.read()
-            temp_file_name = f"temp_{message.document.file_id}.{file_name.split('.')[-1]}"
-            async with aiofiles.open(temp_file_name, 'wb') as f:
-                await f.write(file_bytes)
-            # Faylni ochib, yuborishdan oldin yopilmasligini ta'minlash
-            with open(temp_file_name, 'rb') as photo:
-                await send_to_all(users, bot.send_photo, photo, content_type="photo_document", caption=caption)
-            os.remove(temp_file_name)
-            await message.answer("✅ Rasm reklama barcha foydalanuvchilarga yuborildi!", reply_markup=admin_keyboard)
-        else:
+        if not file_name.endswith(('.jpg', '.png')):
             await message.answer("❌ Faqat .jpg yoki .png formatdagi fayllar qabul qilinadi!")
             return
+        # Rasmni bir marta (admin chatiga) yuklab, olingan file_id orqali barchaga yuboramiz
+        file_info = await bot.get_file(message.document.file_id)
+        downloaded_file = await bot.download_file(file_info.file_path)
+        uploaded = await bot.send_photo(message.chat.id, types.InputFile(downloaded_file, filename=file_name))
+        photo_id = uploaded.photo[-1].file_id
+    await send_to_all(bot.send_photo, photo_id, content_type="photo", caption=caption, admin_chat_id=message.chat.id)
+    await message.answer("✅ Rasm reklama navbatga qo‘shildi! Yuborish tugagach xabar beriladi.", reply_markup=admin_keyboard)
     await state.finish()
 
 @dp.message_handler(content_types=types.ContentType.ANY, state=ReklamaStates.waiting_for_photo)
@@ -778,10 +1147,8 @@ async def handle_wrong_input_photo(message: types.Message):
     await message.answer("❌ Faqat rasm (jpg/png) yuboring!")
 
 # Video reklama
-@dp.message_handler(lambda message: message.text == "🎥 Video")
+@admin_button("🎥 Video")
 async def request_video_reklama(message: types.Message):
-    if message.from_user.id not in ADMINS:
-        return
     await message.answer("Videoni yuboring yoki bekor qilish uchun /cancel bosing:")
     await ReklamaStates.waiting_for_video.set()
 
@@ -789,9 +1156,8 @@ async def request_video_reklama(message: types.Message):
 async def send_video_reklama(message: types.Message, state: FSMContext):
     video_id = message.video.file_id
     caption = message.caption if message.caption else ""
-    users = get_all_users()
-    await send_to_all(users, bot.send_video, video_id, content_type="video", caption=caption)
-    await message.answer("✅ Video reklama barcha foydalanuvchilarga yuborildi!", reply_markup=admin_keyboard)
+    await send_to_all(bot.send_video, video_id, content_type="video", caption=caption, admin_chat_id=message.chat.id)
+    await message.answer("✅ Video reklama navbatga qo‘shildi! Yuborish tugagach xabar beriladi.", reply_markup=admin_keyboard)
     await state.finish()
 
 @dp.message_handler(content_types=types.ContentType.ANY, state=ReklamaStates.waiting_for_video)
@@ -799,10 +1165,8 @@ async def handle_wrong_input_video(message: types.Message):
     await message.answer("❌ Faqat video yuboring!")
 
 # Fayl reklama
-@dp.message_handler(lambda message: message.text == "📁 Fayl")
+@admin_button("📁 Fayl")
 async def request_file_reklama(message: types.Message):
-    if message.from_user.id not in ADMINS:
-        return
     await message.answer("Faylni yuboring yoki bekor qilish uchun /cancel bosing:")
     await ReklamaStates.waiting_for_file.set()
 
@@ -810,9 +1174,8 @@ async def request_file_reklama(message: types.Message):
 async def send_file_reklama(message: types.Message, state: FSMContext):
     document_id = message.document.file_id
     caption = message.caption if message.caption else ""
-    users = get_all_users()
-    await send_to_all(users, bot.send_document, document_id, caption=caption)
-    await message.answer("✅ Fayl reklama barcha foydalanuvchilarga yuborildi!", reply_markup=admin_keyboard)
+    await send_to_all(bot.send_document, document_id, content_type="document", caption=caption, admin_chat_id=message.chat.id)
+    await message.answer("✅ Fayl reklama navbatga qo‘shildi! Yuborish tugagach xabar beriladi.", reply_markup=admin_keyboard)
     await state.finish()
 
 @dp.message_handler(content_types=types.ContentType.ANY, state=ReklamaStates.waiting_for_file)
@@ -820,10 +1183,8 @@ async def handle_wrong_input_file(message: types.Message):
     await message.answer("❌ Faqat fayl (dokument) yuboring!")
 
 # GIF reklama
-@dp.message_handler(lambda message: message.text == "🎞 GIF")
+@admin_button("🎞 GIF")
 async def request_gif_reklama(message: types.Message):
-    if message.from_user.id not in ADMINS:
-        return
     await message.answer("GIFni yuboring yoki bekor qilish uchun /cancel bosing:")
     await ReklamaStates.waiting_for_gif.set()
 
@@ -831,9 +1192,8 @@ async def request_gif_reklama(message: types.Message):
 async def send_gif_reklama(message: types.Message, state: FSMContext):
     gif_id = message.animation.file_id
     caption = message.caption if message.caption else ""
-    users = get_all_users()
-    await send_to_all(users, bot.send_animation, gif_id, caption=caption)
-    await message.answer("✅ GIF reklama barcha foydalanuvchilarga yuborildi!", reply_markup=admin_keyboard)
+    await send_to_all(bot.send_animation, gif_id, content_type="animation", caption=caption, admin_chat_id=message.chat.id)
+    await message.answer("✅ GIF reklama navbatga qo‘shildi! Yuborish tugagach xabar beriladi.", reply_markup=admin_keyboard)
     await state.finish()
 
 @dp.message_handler(content_types=types.ContentType.ANY, state=ReklamaStates.waiting_for_gif)
@@ -841,19 +1201,16 @@ async def handle_wrong_input_gif(message: types.Message):
     await message.answer("❌ Faqat GIF yuboring!")
 
 # Ovozli xabar reklama
-@dp.message_handler(lambda message: message.text == "🎙 Ovozli xabar")
+@admin_button("🎙 Ovozli xabar")
 async def request_voice_reklama(message: types.Message):
-    if message.from_user.id not in ADMINS:
-        return
     await message.answer("Ovozli xabarni yuboring yoki bekor qilish uchun /cancel bosing:")
     await ReklamaStates.waiting_for_voice.set()
 
 @dp.message_handler(content_types=types.ContentType.VOICE, state=ReklamaStates.waiting_for_voice)
 async def send_voice_reklama(message: types.Message, state: FSMContext):
     voice_id = message.voice.file_id
-    users = get_all_users()
-    await send_to_all(users, bot.send_voice, voice_id)
-    await message.answer("✅ Ovozli xabar reklama barcha foydalanuvchilarga yuborildi!", reply_markup=admin_keyboard)
+    await send_to_all(bot.send_voice, voice_id, content_type="voice", admin_chat_id=message.chat.id)
+    await message.answer("✅ Ovozli xabar reklama navbatga qo‘shildi! Yuborish tugagach xabar beriladi.", reply_markup=admin_keyboard)
     await state.finish()
 
 @dp.message_handler(content_types=types.ContentType.ANY, state=ReklamaStates.waiting_for_voice)
@@ -861,19 +1218,16 @@ async def handle_wrong_input_voice(message: types.Message):
     await message.answer("❌ Faqat ovozli xabar yuboring!")
 
 # Lokatsiya reklama
-@dp.message_handler(lambda message: message.text == "📍 Lokatsiya")
+@admin_button("📍 Lokatsiya")
 async def request_location_reklama(message: types.Message):
-    if message.from_user.id not in ADMINS:
-        return
     await message.answer("Lokatsiyani yuboring yoki bekor qilish uchun /cancel bosing:")
     await ReklamaStates.waiting_for_location.set()
 
 @dp.message_handler(content_types=types.ContentType.LOCATION, state=ReklamaStates.waiting_for_location)
 async def send_location_reklama(message: types.Message, state: FSMContext):
     location = message.location
-    users = get_all_users()
-    await send_to_all(users, bot.send_location, location.latitude, location.longitude)
-    await message.answer("✅ Lokatsiya reklama barcha foydalanuvchilarga yuborildi!", reply_markup=admin_keyboard)
+    await send_to_all(bot.send_location, location.latitude, location.longitude, content_type="location", admin_chat_id=message.chat.id)
+    await message.answer("✅ Lokatsiya reklama navbatga qo‘shildi! Yuborish tugagach xabar beriladi.", reply_markup=admin_keyboard)
     await state.finish()
 
 @dp.message_handler(content_types=types.ContentType.ANY, state=ReklamaStates.waiting_for_location)
@@ -881,10 +1235,8 @@ async def handle_wrong_input_location(message: types.Message):
     await message.answer("❌ Faqat lokatsiya yuboring!")
 
 # Musiqa reklama
-@dp.message_handler(lambda message: message.text == "🎵 Musiqa")
+@admin_button("🎵 Musiqa")
 async def request_music_reklama(message: types.Message):
-    if message.from_user.id not in ADMINS:
-        return
     await message.answer("Musiqani yuboring (mp3/m4a) yoki bekor qilish uchun /cancel bosing:")
     await ReklamaStates.waiting_for_music.set()
 
@@ -892,9 +1244,8 @@ async def request_music_reklama(message: types.Message):
 async def send_music_reklama(message: types.Message, state: FSMContext):
     audio_id = message.audio.file_id
     caption = message.caption if message.caption else ""
-    users = get_all_users()
-    await send_to_all(users, bot.send_audio, audio_id, caption=caption)
-    await message.answer("✅ Musiqa reklama barcha foydalanuvchilarga yuborildi!", reply_markup=admin_keyboard)
+    await send_to_all(bot.send_audio, audio_id, content_type="audio", caption=caption, admin_chat_id=message.chat.id)
+    await message.answer("✅ Musiqa reklama navbatga qo‘shildi! Yuborish tugagach xabar beriladi.", reply_markup=admin_keyboard)
     await state.finish()
 
 @dp.message_handler(content_types=types.ContentType.ANY, state=ReklamaStates.waiting_for_music)
@@ -902,16 +1253,12 @@ async def handle_wrong_input_music(message: types.Message):
     await message.answer("❌ Faqat musiqa (audio) yuboring!")
 
 # Majburiy obuna
-@dp.message_handler(lambda message: message.text == "🔗 Majburiy obuna")
+@admin_button("🔗 Majburiy obuna")
 async def majburiy_obuna_menu(message: types.Message):
-    if message.from_user.id not in ADMINS:
-        return
     await message.answer("Majburiy obuna sozlamalari:", reply_markup=majburiy_obuna_keyboard)
 
-@dp.message_handler(lambda message: message.text == "➕ Kanal qo'shish")
+@admin_button("➕ Kanal qo'shish")
 async def add_channel_handler(message: types.Message):
-    if message.from_user.id not in ADMINS:
-        return
     await message.answer("Kanal username ni @ belgisi bilan kiriting (masalan, @channel_username)\nYoki bekor qilish uchun /cancel bosing:")
     await MajburiyObunaStates.waiting_for_channel_username.set()
 
@@ -922,35 +1269,33 @@ async def process_add_channel(message: types.Message, state: FSMContext):
         await message.answer("❌ Noto'g'ri format! Iltimos, @ belgisi bilan kiriting\nYoki bekor qilish uchun /cancel bosing:")
         return
     
-    success = add_channel(channel_username)
+    success = await add_channel(channel_username)
     if success:
+        await refresh_member_events(channel_username.lstrip('@'))
         await message.answer(f"✅ {channel_username} kanali qo'shildi!", reply_markup=admin_keyboard)
     else:
         await message.answer(f"❌ {channel_username} kanali allaqachon mavjud!", reply_markup=admin_keyboard)
     await state.finish()
 
-@dp.message_handler(lambda message: message.text == "➖ Kanalni olib tashlash")
+@admin_button("➖ Kanalni olib tashlash")
 async def remove_channel_handler(message: types.Message):
-    if message.from_user.id not in ADMINS:
-        return
     await message.answer("Olib tashlash uchun kanal username ni kiriting (masalan, @channel_username)\nYoki bekor qilish uchun /cancel bosing:")
     await MajburiyObunaStates.waiting_for_channel_remove.set()
 
 @dp.message_handler(state=MajburiyObunaStates.waiting_for_channel_remove)
 async def process_remove_channel(message: types.Message, state: FSMContext):
     channel_username = message.text.strip().lstrip('@')
-    success = remove_channel(channel_username)
+    success = await remove_channel(channel_username)
     if success:
+        forget_channel_members(channel_username)
         await message.answer(f"✅ @{channel_username} kanali olib tashlandi!", reply_markup=admin_keyboard)
     else:
         await message.answer(f"❌ @{channel_username} kanali topilmadi!", reply_markup=admin_keyboard)
     await state.finish()
 
-@dp.message_handler(lambda message: message.text == "📋 Kanallar ro'yxati")
+@admin_button("📋 Kanallar ro'yxati")
 async def list_channels_handler(message: types.Message):
-    if message.from_user.id not in ADMINS:
-        return
-    channels = get_channels()
+    channels = await get_channels()
     if channels:
         response = "📋 Majburiy obuna kanallari:\n" + "\n".join([f"👉 @{ch}" for ch in channels])
     else:
@@ -965,8 +1310,41 @@ async def handle_unknown_input(message: types.Message):
     else:
         await message.answer("❌ Faqat raqamli kod kiritishingiz mumkin!")
 
+broadcast_task = None
+
+async def on_startup(dispatcher):
+    global broadcast_task
+    await async_database.migrate()
+    async_database.start()
+    await storage.load()
+    await load_channel_members()
+    # Saqlangan (jumladan, to'xtab qolgan) reklamalarni davom ettirish
+    broadcast_task = asyncio.create_task(run_jobs(bot))
+
+async def on_shutdown(dispatcher):
+    if broadcast_task is not None:
+        broadcast_task.cancel()
+        try:
+            await broadcast_task
+        except asyncio.CancelledError:
+            pass
+    export.shutdown()
+    await async_database.shutdown()
+
+ALLOWED_UPDATES = ["message", "callback_query", "chat_member", "my_chat_member"]
+
 if __name__ == "__main__":
     try:
-        executor.start_polling(dp, skip_updates=True)
+        if BOT_MODE == "webhook":
+            from webhook import start_webhook
+            start_webhook(dp, on_startup=on_startup, on_shutdown=on_shutdown, allowed_updates=ALLOWED_UPDATES)
+        else:
+            executor.start_polling(
+                dp,
+                skip_updates=True,
+                on_startup=on_startup,
+                on_shutdown=on_shutdown,
+                allowed_updates=ALLOWED_UPDATES
+            )
     except Exception as e:
         logger.error(f"Bot ishga tushishda xatolik: {e}")
@@ -0,0 +1,317 @@
+"""Reklama (broadcast) yuborish mexanizmi.
+
+Barcha yuborishlar yagona token-bucket cheklovchisidan o'tadi, Telegram
+RetryAfter qaytarsa butun jarayon to'xtab turadi, vaqtinchalik tarmoq
+xatolarida esa kechikish bilan qayta uriniladi.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+
+from aiogram.utils.exceptions import (
+    BotBlocked, BotKicked, CantInitiateConversation, CantTalkWithBots, ChatNotFound,
+    MessageNotModified, NetworkError, RetryAfter, TelegramAPIError, UserDeactivated,
+)
+
+import async_database
+from config import (BROADCAST_RATE, BROADCAST_CONCURRENCY, BROADCAST_MAX_RETRIES, BROADCAST_RETRY_BACKOFF,
+                    BROADCAST_CHECKPOINT_INTERVAL, BROADCAST_PROGRESS_INTERVAL)
+
+logger = logging.getLogger(__name__)
+
+# Qayta urinish befoyda bo'lgan xatolar: foydalanuvchi bloklagan, o'chirilgan va h.k.
+PERMANENT_ERRORS = (BotBlocked, BotKicked, UserDeactivated, ChatNotFound, CantInitiateConversation, CantTalkWithBots)
+# Qayta urinib ko'rsa bo'ladigan xatolar
+TRANSIENT_ERRORS = (NetworkError, asyncio.TimeoutError, ConnectionError)
+
+
+class TokenBucket:
+    """Global tezlik cheklovchisi: soniyasiga `rate` ta ruxsat, `capacity` gacha to'planadi.
+
+    Chelak bo'sh boshlanadi va sig'imi kichik: reklama boshida ham, RetryAfter pauzasidan
+    keyin ham birinchi soniyada `rate` dan ko'p xabar ketmaydi.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        """Barcha yuborishlarni `seconds` soniyaga to'xtatadi (RetryAfter uchun)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    self._updated = time.monotonic()
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# Barcha reklamalar uchun umumiy cheklovchi (Telegram limiti bot bo'yicha global)
+limiter = TokenBucket(BROADCAST_RATE)
+
+
+async def deliver(method, chat_id, *args, **kwargs):
+    """Bitta foydalanuvchiga yuboradi. Natija: ("sent" | "blocked" | "failed", xato turi yoki None).
+
+    Bloklangan/o'chirilgan foydalanuvchilar nofaol deb belgilanadi va keyingi reklamalarda o'tkazib yuboriladi.
+    """
+    attempt = 0
+    while True:
+        await limiter.acquire()
+        try:
+            await method(chat_id, *args, **kwargs)
+            return "sent", None
+        except RetryAfter as e:
+            logger.warning(f"RetryAfter: {e.timeout} soniya kutilmoqda")
+            limiter.pause(e.timeout)
+        except PERMANENT_ERRORS as e:
+            logger.info(f"Foydalanuvchiga yuborib bo'lmaydi: {chat_id} - {e}")
+            async_database.deactivate_user(chat_id, type(e).__name__)
+            return "blocked", type(e).__name__
+        except TRANSIENT_ERRORS as e:
+            if attempt >= BROADCAST_MAX_RETRIES:
+                logger.error(f"Reklama yuborilmadi ({attempt + 1} urinish): {chat_id} - {e}")
+                return "failed", type(e).__name__
+            await asyncio.sleep(BROADCAST_RETRY_BACKOFF * 2 ** attempt)
+            attempt += 1
+        except TelegramAPIError as e:
+            logger.error(f"Reklama yuborishda xatolik: {chat_id} - {e}")
+            return "failed", type(e).__name__
+
+
+async def broadcast(chat_ids, method, *args, content_type="unknown", stats=None, on_checkpoint=None,
+                    progress=None, **kwargs):
+    """chat_ids (asinxron iterator) ga reklamani yuboradi va natijalar sonini qaytaradi.
+
+    ID'lar cheklangan navbat orqali belgilangan sondagi ishchilarga uzatiladi,
+    shuning uchun xotira foydalanuvchilar soniga bog'liq emas. on_checkpoint(last_id)
+    vaqti-vaqti bilan chaqiriladi: last_id gacha (u ham) bo'lgan barcha ID'lar qayta ishlangan.
+    """
+    queue = asyncio.Queue(maxsize=BROADCAST_CONCURRENCY * 2)
+    stats = stats or {"sent": 0, "blocked": 0, "failed": 0}
+    started = time.monotonic()
+    # Tartib bilan yuborilgan, lekin hali tugallanmagan ID'lar
+    dispatched = deque()
+    done = set()
+    checkpoint = {"last_id": None, "saved_at": time.monotonic()}
+
+    async def save_checkpoint():
+        checkpoint["saved_at"] = time.monotonic()
+        if on_checkpoint is not None and checkpoint["last_id"] is not None:
+            await on_checkpoint(checkpoint["last_id"])
+
+    async def worker():
+        while True:
+            chat_id = await queue.get()
+            try:
+                if chat_id is None:
+                    return
+                result, reason = await deliver(method, chat_id, *args, **kwargs)
+                stats[result] += 1
+                if progress is not None and reason is not None:
+                    progress.errors[reason] = progress.errors.get(reason, 0) + 1
+                done.add(chat_id)
+                while dispatched and dispatched[0] in done:
+                    checkpoint["last_id"] = dispatched.popleft()
+                    done.discard(checkpoint["last_id"])
+                if time.monotonic() - checkpoint["saved_at"] >= BROADCAST_CHECKPOINT_INTERVAL:
+                    await save_checkpoint()
+            finally:
+                queue.task_done()
+
+    workers = [asyncio.create_task(worker()) for _ in range(BROADCAST_CONCURRENCY)]
+    try:
+        async for chat_id in chat_ids:
+            dispatched.append(chat_id)
+            await queue.put(chat_id)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+        await save_checkpoint()
+    elapsed = time.monotonic() - started
+    logger.info(
+        f"Reklama ({content_type}) tugadi: {stats['sent']} yuborildi, {stats['blocked']} bloklangan, "
+        f"{stats['failed']} xato, {elapsed:.1f} s"
+    )
+    return stats
+
+
+# Yangi vazifa qo'shilganda ishchini uyg'otish uchun
+_job_event = None
+
+
+def notify_new_job():
+    if _job_event is not None:
+        _job_event.set()
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+class BroadcastProgress:
+    """Reklama jarayoni ko'rsatkichlari: tezlik, qolgan vaqt va xato turlari."""
+
+    def __init__(self, job_id, content_type, stats, remaining):
+        self.job_id = job_id
+        self.content_type = content_type
+        self.stats = stats
+        self.errors = {}
+        self.started = time.monotonic()
+        self.initial = self.processed
+        self.total = self.initial + remaining
+        # Oxirgi o'lchovlar (vaqt, qayta ishlanganlar) — joriy tezlikni hisoblash uchun
+        self._samples = deque([(self.started, self.initial)], maxlen=6)
+
+    @property
+    def processed(self):
+        return self.stats["sent"] + self.stats["blocked"] + self.stats["failed"]
+
+    def current_rate(self):
+        now, processed = time.monotonic(), self.processed
+        self._samples.append((now, processed))
+        then, before = self._samples[0]
+        return (processed - before) / (now - then) if now > then else 0.0
+
+    def average_rate(self):
+        elapsed = time.monotonic() - self.started
+        return (self.processed - self.initial) / elapsed if elapsed > 0 else 0.0
+
+    def _counters(self):
+        text = (
+            f"✅ Yuborildi: {self.stats['sent']}\n"
+            f"🚫 Bloklangan: {self.stats['blocked']}\n"
+            f"❌ Xato: {self.stats['failed']}\n"
+        )
+        if self.errors:
+            text += "🔎 Turlari: " + ", ".join(f"{name}: {count}" for name, count in sorted(self.errors.items())) + "\n"
+        return text
+
+    def render(self):
+        rate = self.current_rate()
+        remaining = max(self.total - self.processed, 0)
+        eta = format_duration(remaining / rate) if rate > 0 else "—"
+        percent = self.processed / self.total if self.total else 1
+        return (
+            f"📢 Reklama #{self.job_id} ({self.content_type}) yuborilmoqda...\n"
+            f"📈 Jarayon: {self.processed}/{self.total} ({percent:.0%})\n"
+            + self._counters()
+            + f"⚡ Tezlik: {rate:.1f} xabar/s\n"
+            f"⏳ Qolgan vaqt: {eta}"
+        )
+
+    def summary(self):
+        return (
+            f"🏁 Reklama #{self.job_id} ({self.content_type}) yakunlandi!\n"
+            + self._counters()
+            + f"⏱ Davomiyligi: {format_duration(time.monotonic() - self.started)}\n"
+            f"⚡ O'rtacha tezlik: {self.average_rate():.1f} xabar/s (limit: {BROADCAST_RATE:g})"
+        )
+
+
+async def report_progress(bot, chat_id, message_id, progress):
+    """Holat xabarini BROADCAST_PROGRESS_INTERVAL oralig'ida tahrirlaydi."""
+    while True:
+        await asyncio.sleep(BROADCAST_PROGRESS_INTERVAL)
+        await limiter.acquire()
+        try:
+            await bot.edit_message_text(progress.render(), chat_id, message_id)
+        except MessageNotModified:
+            pass
+        except TelegramAPIError as e:
+            logger.warning(f"Reklama holatini yangilab bo'lmadi: {e}")
+
+
+async def notify_admin(bot, admin_chat_id, text):
+    """Adminga xabar yuboradi; yuborib bo'lmasa (masalan, botni bloklagan) reklama to'xtamaydi."""
+    if not admin_chat_id:
+        return None
+    try:
+        return await bot.send_message(admin_chat_id, text)
+    except TelegramAPIError as e:
+        logger.warning(f"Adminga ({admin_chat_id}) xabar yuborib bo'lmadi: {e}")
+        return None
+
+
+async def run_job(bot, job):
+    """Bitta saqlangan reklama vazifasini oxirgi checkpoint'dan davom ettiradi."""
+    job_id = job["id"]
+    stats = job["stats"]
+    admin_chat_id = job["admin_chat_id"]
+    await async_database.set_broadcast_job_status(job_id, "running")
+
+    async def on_checkpoint(last_user_id):
+        await async_database.save_broadcast_checkpoint(job_id, last_user_id, stats)
+
+    if job["last_user_id"]:
+        logger.info(f"Reklama #{job_id} {job['last_user_id']} dan davom ettirilmoqda")
+    reporter = None
+    try:
+        remaining = await async_database.count_active_users_after(job["last_user_id"])
+        progress = BroadcastProgress(job_id, job["content_type"], stats, remaining)
+        status_message = await notify_admin(bot, admin_chat_id, progress.render())
+        if status_message is not None:
+            reporter = asyncio.create_task(report_progress(bot, admin_chat_id, status_message.message_id, progress))
+        await broadcast(
+            async_database.iter_user_ids(job["last_user_id"]), getattr(bot, job["method"]), *job["args"],
+            content_type=job["content_type"], stats=stats, on_checkpoint=on_checkpoint, progress=progress,
+            **job["kwargs"]
+        )
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Reklama #{job_id} xatolik bilan to'xtadi: {e}")
+        await async_database.set_broadcast_job_status(job_id, "failed")
+        await notify_admin(bot, admin_chat_id, f"❌ Reklama #{job_id} xatolik bilan to'xtadi!")
+        return
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+    await async_database.set_broadcast_job_status(job_id, "done")
+    summary = progress.summary()
+    logger.info(summary)
+    await notify_admin(bot, admin_chat_id, summary)
+
+
+async def run_jobs(bot):
+    """Navbatdagi reklama vazifalarini birma-bir bajaradi (bot ishlab turgan vaqt davomida)."""
+    global _job_event
+    _job_event = asyncio.Event()
+    while True:
+        _job_event.clear()
+        job = await async_database.get_next_broadcast_job()
+        if job is None:
+            await _job_event.wait()
+            continue
+        try:
+            await run_job(bot, job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Reklama vazifasini bajarishda xatolik: {e}")
+            # Vazifa "running" holatida qolib, navbatni abadiy to'sib qo'ymasligi uchun
+            try:
+                await async_database.set_broadcast_job_status(job["id"], "failed")
+            except Exception as e:
+                logger.error(f"Reklama #{job['id']} holatini yangilab bo'lmadi: {e}")
+            await asyncio.sleep(5)
@@ -0,0 +1,117 @@
+from collections import OrderedDict
+import threading
+import time
+
+
+class TTLCache:
+    """Kalit bo'yicha qiymatni ma'lum muddat (TTL) saqlaydigan oddiy kesh.
+
+    To'lganda eng avval yozilgan kalit chiqariladi (O(1), butun keshni aylanib chiqmasdan).
+    """
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Qiymatni qaytaradi, muddati o'tgan yoki yo'q bo'lsa None."""
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        value, expires_at = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl):
+        """Qiymatni ttl soniyaga saqlaydi."""
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+class LRUCache:
+    """Hajmi cheklangan, eng kam ishlatilganini chiqarib tashlaydigan kesh.
+
+    Bir nechta oqimdan ishlatsa bo'ladi. Bazadan o'qib keshga yozishda o'qishdan oldin
+    version() olinadi va set() ga beriladi: orada invalidate() bo'lgan bo'lsa, eskirgan qiymat yozilmaydi.
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Qiymatni qaytaradi; topilmasa default."""
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def version(self):
+        """Invalidatsiyalar hisoblagichi (set() dagi version argumenti uchun)."""
+        return self._version
+
+    def set(self, key, value, version=None):
+        """Qiymatni yozadi; version berilgan va undan keyin invalidatsiya bo'lgan bo'lsa yozmaydi."""
+        with self._lock:
+            if version is not None and version != self._version:
+                return False
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            return True
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+            self._version += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._version += 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
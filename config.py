@@ -10,6 +10,74 @@ ADMIN_IDS = [int(x.strip()) for x in os.getenv("ADMIN_IDS", "").split(",") if x.
 DB_NAME = os.getenv("DB_NAME", "database.db")  # Default qiymat bilan
 API_KEY = os.getenv("API_KEY", "")  # Ixtiyoriy, agar ishlatilsa
 
+# Obuna tekshiruvi keshi (soniyalarda)
+SUBSCRIPTION_CACHE_TTL = int(os.getenv("SUBSCRIPTION_CACHE_TTL", "300"))  # Obuna bo'lganlar uchun
+SUBSCRIPTION_NEGATIVE_TTL = int(os.getenv("SUBSCRIPTION_NEGATIVE_TTL", "30"))  # Obuna bo'lmaganlar uchun
+SUBSCRIPTION_CACHE_SIZE = int(os.getenv("SUBSCRIPTION_CACHE_SIZE", "100000"))  # Yozuvlar soni
+# chat_member indeksidagi yozuvga shuncha soniya ishoniladi (bot o'chiq paytdagi o'zgarishlar kelmaydi)
+CHANNEL_MEMBER_MAX_AGE = int(os.getenv("CHANNEL_MEMBER_MAX_AGE", "86400"))
+
+# Fayl kodlari keshi hajmi (yozuvlar soni)
+FILE_CACHE_SIZE = int(os.getenv("FILE_CACHE_SIZE", "10000"))
+
+# Ma'lumotlar bazasi o'quvchi ulanishlari soni
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "4"))
+
+# Kechiktirilgan yozish: navbat shu hajmga yetganda yoki shu vaqt (soniya) o'tganda yoziladi
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "500"))
+WRITE_FLUSH_INTERVAL = float(os.getenv("WRITE_FLUSH_INTERVAL", "1.0"))
+
+# SQLite sozlamalari (PRAGMA)
+DB_JOURNAL_MODE = os.getenv("DB_JOURNAL_MODE", "WAL")
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "65536"))  # 64 MB sahifa keshi
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))  # 256 MB
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_MAINTENANCE_INTERVAL = int(os.getenv("DB_MAINTENANCE_INTERVAL", "600"))  # wal_checkpoint / optimize oralig'i (soniya)
+
+# Migratsiyada eski qatorlarni ko'chirish partiyasi va partiyalar orasidagi pauza (soniya)
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "5000"))
+MIGRATION_BATCH_PAUSE = float(os.getenv("MIGRATION_BATCH_PAUSE", "0.05"))
+
+# Reklama yuborish: soniyasiga xabarlar (Telegram limiti ~30), parallel so'rovlar, qayta urinishlar
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "28"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "30"))
+BROADCAST_MAX_RETRIES = int(os.getenv("BROADCAST_MAX_RETRIES", "3"))
+BROADCAST_RETRY_BACKOFF = float(os.getenv("BROADCAST_RETRY_BACKOFF", "1.0"))
+BROADCAST_CHECKPOINT_INTERVAL = float(os.getenv("BROADCAST_CHECKPOINT_INTERVAL", "5"))  # Holatni saqlash oralig'i (soniya)
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "10"))  # Admin holat xabarini yangilash oralig'i (soniya)
+
+# FSM holatlari: faol bo'lmagan holat saqlanadigan vaqt (soniya) va xotiradagi kesh hajmi
+FSM_TTL = int(os.getenv("FSM_TTL", "86400"))
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "1000"))
+
+# Albom yuklash: oxirgi qism kelgach shuncha soniya kutilib, barcha fayllar bitta kodga saqlanadi
+ALBUM_COLLECT_DELAY = float(os.getenv("ALBUM_COLLECT_DELAY", "1.5"))
+
+# So'rovlar jurnalini saqlash: shu kundan eski xom so'rovlar kunlik yig'maga siqiladi (0 — o'chirilgan)
+REQUEST_RETENTION_DAYS = int(os.getenv("REQUEST_RETENTION_DAYS", "180"))
+RETENTION_INTERVAL = int(os.getenv("RETENTION_INTERVAL", "3600"))  # Siqishni tekshirish oralig'i (soniya)
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "1000"))
+RETENTION_BATCH_PAUSE = float(os.getenv("RETENTION_BATCH_PAUSE", "0.05"))
+RETENTION_VACUUM_PAGES = int(os.getenv("RETENTION_VACUUM_PAGES", "1000"))  # incremental_vacuum qadami (sahifa)
+
+# Faollik tahlili: DAU uchun kunlar soni va retention kogortalari uchun haftalar soni
+ANALYTICS_DAYS = int(os.getenv("ANALYTICS_DAYS", "30"))
+ANALYTICS_WEEKS = int(os.getenv("ANALYTICS_WEEKS", "8"))
+
+# Ishga tushirish rejimi: "polling" (standart, ishlab chiqish uchun) yoki "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # Telegram yuboradigan tashqi manzil, masalan https://example.com/webhook
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_LISTEN_HOST = os.getenv("WEBHOOK_LISTEN_HOST", "0.0.0.0")
+WEBHOOK_LISTEN_PORT = int(os.getenv("WEBHOOK_LISTEN_PORT", "8080"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # X-Telegram-Bot-Api-Secret-Token sarlavhasi
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", "100"))  # Bir vaqtda ishlanadigan update'lar
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))  # Telegram ochadigan ulanishlar (1-100)
+# Faqat lokal yuklama testi uchun: berilsa bot so'rovlari haqiqiy Telegram'ga emas, shu manzildagi soxta API'ga
+# (fake_telegram.py) yuboriladi, masalan http://127.0.0.1:8081. Ishlab turgan botda bo'sh qoldiring.
+LOCAL_BOT_API_URL = os.getenv("LOCAL_BOT_API_URL", "")
+
 # Tekshirish uchun log
 if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN .env faylida topilmadi!")
@@ -1,82 +1,433 @@
 import sqlite3
+import json
 import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
+from cache import LRUCache
+from config import (FILE_CACHE_SIZE, DB_READ_POOL_SIZE, DB_JOURNAL_MODE, DB_SYNCHRONOUS,
+                    DB_CACHE_SIZE_KB, DB_MMAP_SIZE, DB_BUSY_TIMEOUT_MS)
 
 DB_NAME = "bot_database.db"
 
-def create_tables():
-    """Ma'lumotlar bazasida jadvallarni va indekslarni yaratadi."""
-    with sqlite3.connect(DB_NAME) as conn:
-        cursor = conn.cursor()
-        # Users jadvali
-        cursor.execute('''CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER UNIQUE,
-            first_name TEXT,
-            last_name TEXT,
-            username TEXT,
-            created_at TEXT
-        )''')
-        # Files jadvali
-        cursor.execute('''CREATE TABLE IF NOT EXISTS files (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            file_code TEXT UNIQUE,
-            file_id TEXT,
-            file_link TEXT,
-            file_type TEXT,
-            caption TEXT,
-            uploaded_at TEXT
-        )''')
-        # Channels jadvali
-        cursor.execute('''CREATE TABLE IF NOT EXISTS channels (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT NOT NULL UNIQUE
-        )''')
-        # File_requests jadvali
-        cursor.execute('''CREATE TABLE IF NOT EXISTS file_requests (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            file_code TEXT,
-            requested_at TEXT,
-            FOREIGN KEY (user_id) REFERENCES users(user_id)
-        )''')
-
-        # Indekslar qo‘shish
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_user_id ON users(user_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_file_code ON files(file_code)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_file_requests_user_id ON file_requests(user_id)")
+# file_code -> (file_id, file_link, file_type, caption, items); mavjud bo'lmagan kodlar uchun None.
+# items — albom kodlari uchun [(file_id, file_type, caption), ...], boshqalar uchun None
+file_cache = LRUCache(FILE_CACHE_SIZE)
+_NOT_CACHED = object()
+_channels_cache = None
+_channels_version = 0
+_channels_lock = threading.Lock()
+# file_type (None — barchasi) -> fayllar soni; fayl qo'shilsa/o'chirilsa tozalanadi
+_file_count_cache = LRUCache(64)
 
-        conn.commit()
+# (jadval, eski TEXT ustun, yangi epoch ustun)
+TIMESTAMP_COLUMNS = [
+    ("users", "created_at", "created_ts"),
+    ("files", "uploaded_at", "uploaded_ts"),
+    ("file_requests", "requested_at", "requested_ts"),
+]
+
+def _ts_text(ts_column, text_column):
+    """Epoch ustunini ko'rsatish uchun matnga aylantiradigan SQL ifoda (backfill tugamagan qatorlar uchun TEXT)."""
+    return f"COALESCE(strftime('%Y-%m-%d %H:%M:%S', {ts_column}, 'unixepoch', 'localtime'), {text_column})"
+
+def to_epoch(date_text):
+    """'YYYY-MM-DD HH:MM:SS' (mahalliy vaqt) qiymatini epoch soniyaga aylantiradi."""
+    return int(datetime.strptime(date_text, "%Y-%m-%d %H:%M:%S").timestamp())
+
+# Uzoq yashovchi ulanishlar: bitta yozuvchi va bir nechta o'quvchi
+_write_conn = None
+_write_lock = threading.Lock()
+_read_pool = queue.Queue()
+_read_conns = []
+_read_pool_lock = threading.Lock()
+
+def _connect():
+    """Yangi ulanish ochib, unga PRAGMA sozlamalarini qo'llaydi."""
+    conn = sqlite3.connect(DB_NAME, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    conn.execute(f"PRAGMA busy_timeout = {int(DB_BUSY_TIMEOUT_MS)}")
+    conn.execute(f"PRAGMA journal_mode = {DB_JOURNAL_MODE}")
+    conn.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA cache_size = -{int(DB_CACHE_SIZE_KB)}")
+    conn.execute(f"PRAGMA mmap_size = {int(DB_MMAP_SIZE)}")
+    return conn
+
+@contextmanager
+def write_connection():
+    """Yagona yozuvchi ulanishni beradi; muvaffaqiyatda commit, xatoda rollback."""
+    global _write_conn
+    with _write_lock:
+        if _write_conn is None:
+            _write_conn = _connect()
+        with _write_conn:
+            yield _write_conn
+
+@contextmanager
+def read_connection():
+    """O'quvchi ulanishlar hovuzidan bittasini vaqtincha beradi."""
+    try:
+        conn = _read_pool.get_nowait()
+    except queue.Empty:
+        with _read_pool_lock:
+            if len(_read_conns) < DB_READ_POOL_SIZE:
+                conn = _connect()
+                _read_conns.append(conn)
+            else:
+                conn = None
+        if conn is None:
+            conn = _read_pool.get()
+    try:
+        yield conn
+    finally:
+        _read_pool.put(conn)
+
+def run_maintenance():
+    """WAL faylini asosiy bazaga ko'chiradi va so'rov rejalashtiruvchi statistikasini yangilaydi."""
+    with write_connection() as conn:
+        checkpoint = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+        conn.execute("PRAGMA optimize")
+    return checkpoint
+
+def close_connections():
+    """Barcha ochiq ulanishlarni yopadi (bot to'xtaganda)."""
+    global _write_conn
+    with _write_lock:
+        if _write_conn is not None:
+            _write_conn.close()
+            _write_conn = None
+    with _read_pool_lock:
+        for conn in _read_conns:
+            conn.close()
+        _read_conns.clear()
+        while not _read_pool.empty():
+            _read_pool.get_nowait()
+
+def _migration_1_create_tables(cursor):
+    """Boshlang'ich sxema: jadvallar va indekslar."""
+    # Users jadvali
+    cursor.execute('''CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER UNIQUE,
+        first_name TEXT,
+        last_name TEXT,
+        username TEXT,
+        created_at TEXT
+    )''')
+    # Files jadvali
+    cursor.execute('''CREATE TABLE IF NOT EXISTS files (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_code TEXT UNIQUE,
+        file_id TEXT,
+        file_link TEXT,
+        file_type TEXT,
+        caption TEXT,
+        uploaded_at TEXT
+    )''')
+    # Channels jadvali
+    cursor.execute('''CREATE TABLE IF NOT EXISTS channels (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL UNIQUE
+    )''')
+    # File_requests jadvali
+    cursor.execute('''CREATE TABLE IF NOT EXISTS file_requests (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        file_code TEXT,
+        requested_at TEXT,
+        FOREIGN KEY (user_id) REFERENCES users(user_id)
+    )''')
+    # Channel_members jadvali (chat_member yangilanishlaridan to'ldiriladi)
+    cursor.execute('''CREATE TABLE IF NOT EXISTS channel_members (
+        channel TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        is_member INTEGER NOT NULL,
+        updated_at TEXT,
+        PRIMARY KEY (channel, user_id)
+    )''')
+
+    # Indekslar qo‘shish
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_user_id ON users(user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_file_code ON files(file_code)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_file_requests_user_id ON file_requests(user_id)")
+
+def _migration_2_epoch_columns(cursor):
+    """Vaqt ustunlari uchun butun sonli (epoch) ustunlar qo'shadi.
+
+    Eski TEXT qiymatlar fonda, kichik partiyalarda ko'chiriladi (backfill_timestamps_batch).
+    """
+    for table, _, ts_column in TIMESTAMP_COLUMNS:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {ts_column} INTEGER")
+
+def _migration_3_composite_indexes(cursor):
+    """So'rovlarga mos kompozit indekslar; ortiqcha indekslarni olib tashlaydi."""
+    # UNIQUE ustunlar allaqachon indekslangan, user_id indeksi esa kompozit indeksning prefiksi
+    cursor.execute("DROP INDEX IF EXISTS idx_users_user_id")
+    cursor.execute("DROP INDEX IF EXISTS idx_files_file_code")
+    cursor.execute("DROP INDEX IF EXISTS idx_file_requests_user_id")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_file_requests_user_ts ON file_requests(user_id, requested_ts, file_code)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_file_requests_code_ts ON file_requests(file_code, requested_ts)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_type_ts ON files(file_type, uploaded_ts)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_files_uploaded_ts ON files(uploaded_ts)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_created_ts ON users(created_ts)")
+
+def _migration_4_broadcast_jobs(cursor):
+    """Reklama vazifalari jadvali (qayta ishga tushganda davom ettirish uchun)."""
+    cursor.execute('''CREATE TABLE IF NOT EXISTS broadcast_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        content_type TEXT NOT NULL,
+        method TEXT NOT NULL,
+        args TEXT NOT NULL,
+        kwargs TEXT NOT NULL,
+        admin_chat_id INTEGER,
+        status TEXT NOT NULL DEFAULT 'pending',
+        last_user_id INTEGER NOT NULL DEFAULT 0,
+        sent INTEGER NOT NULL DEFAULT 0,
+        blocked INTEGER NOT NULL DEFAULT 0,
+        failed INTEGER NOT NULL DEFAULT 0,
+        created_ts INTEGER,
+        updated_ts INTEGER
+    )''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_status ON broadcast_jobs(status, id)")
+
+def _migration_5_user_activity(cursor):
+    """Foydalanuvchi faolligi ustunlari va faollar uchun qisman indeks."""
+    cursor.execute("ALTER TABLE users ADD COLUMN is_active INTEGER NOT NULL DEFAULT 1")
+    cursor.execute("ALTER TABLE users ADD COLUMN inactive_reason TEXT")
+    cursor.execute("ALTER TABLE users ADD COLUMN inactive_ts INTEGER")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_active ON users(user_id) WHERE is_active = 1")
+
+def _migration_6_fsm_states(cursor):
+    """FSM holatlari jadvali (bot qayta ishga tushganda holatlar yo'qolmasligi uchun)."""
+    cursor.execute('''CREATE TABLE IF NOT EXISTS fsm_states (
+        chat_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        state TEXT,
+        data TEXT,
+        updated_ts INTEGER NOT NULL,
+        PRIMARY KEY (chat_id, user_id)
+    ) WITHOUT ROWID''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_fsm_states_updated_ts ON fsm_states(updated_ts)")
+
+def _migration_7_rollups(cursor):
+    """Statistika uchun oldindan hisoblangan hisoblagichlar va yig'ma jadvallar."""
+    cursor.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID")
+    cursor.execute('''CREATE TABLE IF NOT EXISTS user_request_counts (
+        user_id INTEGER PRIMARY KEY,
+        request_count INTEGER NOT NULL DEFAULT 0,
+        last_requested_ts INTEGER
+    )''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS daily_code_requests (
+        day TEXT NOT NULL,
+        file_code TEXT NOT NULL,
+        request_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (day, file_code)
+    ) WITHOUT ROWID''')
+    # Foydalanuvchilar soni trigger'lar bilan yuritiladi: upsert'da qator qo'shildimi yoki yo'qmi, aniq bilinadi
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS trg_users_insert AFTER INSERT ON users BEGIN
+        UPDATE counters SET value = value + 1 WHERE name = 'users';
+        UPDATE counters SET value = value + NEW.is_active WHERE name = 'active_users';
+    END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS trg_users_delete AFTER DELETE ON users BEGIN
+        UPDATE counters SET value = value - 1 WHERE name = 'users';
+        UPDATE counters SET value = value - OLD.is_active WHERE name = 'active_users';
+    END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS trg_users_activity AFTER UPDATE OF is_active ON users
+        WHEN NEW.is_active != OLD.is_active BEGIN
+        UPDATE counters SET value = value + NEW.is_active - OLD.is_active WHERE name = 'active_users';
+    END''')
+    # Foydalanuvchilar soni qisman indekslar bo'yicha tez sanaladi; mavjud so'rovlar esa fonda,
+    # partiyalarda qo'shiladi (seed_rollups_batch) — katta file_requests ishga tushishni to'xtatib qo'ymaydi
+    cursor.execute("""INSERT OR REPLACE INTO counters (name, value)
+                      SELECT 'users', COUNT(*) FROM users
+                      UNION ALL SELECT 'active_users', COUNT(*) FROM users WHERE is_active = 1
+                      UNION ALL SELECT 'file_requests', 0""")
+    _register_backfill(cursor, "rollups", "file_requests")
+
+def _migration_8_hourly_code_requests(cursor):
+    """Soatlik so'rovlar yig'masi (kod bo'yicha) — top fayllar hisoboti uchun."""
+    cursor.execute('''CREATE TABLE IF NOT EXISTS hourly_code_requests (
+        hour_ts INTEGER NOT NULL,
+        file_code TEXT NOT NULL,
+        request_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (hour_ts, file_code)
+    ) WITHOUT ROWID''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_hourly_code_requests_code ON hourly_code_requests(file_code, hour_ts, request_count)")
+    # Yig'ma faqat top hisobotlari qamraydigan oxirgi davr uchun, fonda to'ldiriladi (seed_rollups_batch)
+    since = int(time.time()) - max(TOP_PERIODS.values())
+    _register_backfill(cursor, "hourly_rollups", "file_requests", _first_request_id_since(cursor, since) - 1)
+
+def _migration_9_compacted_requests(cursor):
+    """Saqlash muddati o'tgan so'rovlar uchun kunlik (foydalanuvchi, kod) yig'ma jadvali."""
+    cursor.execute('''CREATE TABLE IF NOT EXISTS daily_user_code_requests (
+        user_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        file_code TEXT NOT NULL,
+        request_count INTEGER NOT NULL DEFAULT 0,
+        first_ts INTEGER NOT NULL,
+        last_ts INTEGER NOT NULL,
+        PRIMARY KEY (user_id, day, file_code)
+    ) WITHOUT ROWID''')
+
+def _migration_10_file_items(cursor):
+    """Ko'p faylli (albom) kodlar: kodga biriktirilgan tartiblangan media ro'yxati."""
+    cursor.execute('''CREATE TABLE IF NOT EXISTS file_items (
+        file_code TEXT NOT NULL,
+        position INTEGER NOT NULL,
+        file_id TEXT NOT NULL,
+        file_type TEXT NOT NULL,
+        caption TEXT,
+        PRIMARY KEY (file_code, position)
+    ) WITHOUT ROWID''')
+
+def _register_backfill(cursor, name, table, after_id=0):
+    """Fon backfill vazifasini ro'yxatga oladi: after_id dan hozirgi eng katta id gacha bo'lgan qatorlar ishlanadi.
+
+    Undan keyin qo'shiladigan qatorlar allaqachon yangi formatda yoziladi.
+    """
+    cursor.execute('''CREATE TABLE IF NOT EXISTS backfill_progress (
+        name TEXT PRIMARY KEY,
+        next_id INTEGER NOT NULL,
+        max_id INTEGER NOT NULL
+    ) WITHOUT ROWID''')
+    cursor.execute(f"INSERT OR IGNORE INTO backfill_progress (name, next_id, max_id) SELECT ?, ?, COALESCE(MAX(id), 0) FROM {table}",
+                   (name, max(after_id, 0)))
+
+def _migration_11_backfill_progress(cursor):
+    """Fon backfill holati: tugagan vazifalar har ishga tushishda qaytadan yurmaydi."""
+    for table, _, ts_column in TIMESTAMP_COLUMNS:
+        _register_backfill(cursor, f"{table}.{ts_column}", table)
+
+# (versiya, funksiya) — versiya PRAGMA user_version da saqlanadi
+MIGRATIONS = [
+    (1, _migration_1_create_tables),
+    (2, _migration_2_epoch_columns),
+    (3, _migration_3_composite_indexes),
+    (4, _migration_4_broadcast_jobs),
+    (5, _migration_5_user_activity),
+    (6, _migration_6_fsm_states),
+    (7, _migration_7_rollups),
+    (8, _migration_8_hourly_code_requests),
+    (9, _migration_9_compacted_requests),
+    (10, _migration_10_file_items),
+    (11, _migration_11_backfill_progress),
+]
 
+def migrate():
+    """Bazani oxirgi sxema versiyasigacha yangilaydi. Har bir migratsiya alohida tranzaksiyada."""
+    with write_connection() as conn:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version == 0 and conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()[0] == 0:
+            # Yangi bo'sh baza: o'chirilgan qatorlar joyini fayldan bosqichma-bosqich qaytarish imkoni.
+            # journal_mode sarlavhani yozib qo'ygani uchun rejim VACUUM dan keyin kuchga kiradi.
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+        for number, migration in MIGRATIONS:
+            if number <= version:
+                continue
+            logging.info(f"Migratsiya {number}: {migration.__doc__.splitlines()[0]}")
+            conn.execute("BEGIN")
+            try:
+                migration(conn.cursor())
+                conn.execute(f"PRAGMA user_version = {number}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            version = number
+    return version
 
+def get_backfill_progress(name):
+    """Fon backfill vazifasining (keyingi id, oxirgi id) holati; vazifa tugagan yoki yo'q bo'lsa None."""
+    with read_connection() as conn:
+        return conn.execute("SELECT next_id, max_id FROM backfill_progress WHERE name = ? AND next_id < max_id",
+                            (name,)).fetchone()
+
+def _set_backfill_progress(conn, name, next_id):
+    conn.execute("UPDATE backfill_progress SET next_id = MIN(?, max_id) WHERE name = ?", (next_id, name))
+
+def backfill_timestamps_batch(table, text_column, ts_column, after_id, batch_size):
+    """id oralig'idagi TEXT vaqtlarni epoch ustuniga ko'chiradi va holatni saqlaydi. Qisqa tranzaksiya."""
+    epoch = f"CAST(strftime('%s', {text_column}, 'utc') AS INTEGER)"
+    with write_connection() as conn:
+        cursor = conn.execute(
+            f"""UPDATE {table}
+                SET {ts_column} = {epoch},
+                    {text_column} = CASE WHEN {epoch} IS NULL THEN {text_column} ELSE NULL END
+                WHERE id > ? AND id <= ? AND {ts_column} IS NULL AND {text_column} IS NOT NULL""",
+            (after_id, after_id + batch_size))
+        _set_backfill_progress(conn, f"{table}.{ts_column}", after_id + batch_size)
+        return cursor.rowcount
 
 def add_user(user_id, first_name, last_name, username):
-    """Foydalanuvchini qo'shadi."""
-    with sqlite3.connect(DB_NAME) as conn:
+    """Foydalanuvchini qo'shadi; nofaol bo'lsa qayta faollashtiradi."""
+    with write_connection() as conn:
         cursor = conn.cursor()
-        created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        cursor.execute('''INSERT OR IGNORE INTO users (user_id, first_name, last_name, username, created_at) 
-                          VALUES (?, ?, ?, ?, ?)''', 
-                       (user_id, first_name, last_name, username, created_at))
+        created_ts = int(time.time())
+        cursor.execute('''INSERT INTO users (user_id, first_name, last_name, username, created_ts)
+                          VALUES (?, ?, ?, ?, ?)
+                          ON CONFLICT(user_id) DO UPDATE SET is_active = 1, inactive_reason = NULL, inactive_ts = NULL
+                          WHERE is_active = 0''',
+                       (user_id, first_name, last_name, username, created_ts))
         conn.commit()
 
+def add_users_bulk(rows):
+    """Bir nechta foydalanuvchini bitta tranzaksiyada qo'shadi (nofaollarini qayta faollashtiradi).
+
+    rows: (user_id, first_name, last_name, username, created_ts) ro'yxati.
+    """
+    with write_connection() as conn:
+        conn.executemany('''INSERT INTO users (user_id, first_name, last_name, username, created_ts)
+                              VALUES (?, ?, ?, ?, ?)
+                              ON CONFLICT(user_id) DO UPDATE SET is_active = 1, inactive_reason = NULL, inactive_ts = NULL
+                              WHERE is_active = 0''', rows)
+
+def deactivate_users_bulk(rows):
+    """Botni bloklagan yoki o'chirilgan foydalanuvchilarni nofaol deb belgilaydi.
+
+    rows: (inactive_reason, inactive_ts, user_id) ro'yxati.
+    """
+    with write_connection() as conn:
+        conn.executemany('''UPDATE users SET is_active = 0, inactive_reason = ?, inactive_ts = ?
+                              WHERE user_id = ?''', rows)
+
+def get_counter(name):
+    """counters jadvalidagi oldindan hisoblangan qiymat."""
+    with read_connection() as conn:
+        row = conn.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
 def get_user_count():
     """Foydalanuvchilar sonini qaytaradi."""
-    with sqlite3.connect(DB_NAME) as conn:
+    return get_counter("users")
+
+def get_active_user_count():
+    """Faol (botni bloklamagan) foydalanuvchilar sonini qaytaradi."""
+    return get_counter("active_users")
+
+def count_active_users_after(after_user_id=0):
+    """user_id > after_user_id bo'lgan faol foydalanuvchilar soni (reklama ETA si uchun)."""
+    with read_connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM users WHERE is_active = 1 AND user_id > ?", (after_user_id,)).fetchone()[0]
+
+def get_user(user_id):
+    """Bitta foydalanuvchi ma'lumotlarini qaytaradi."""
+    with read_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM users")
-        return cursor.fetchone()[0]
+        cursor.execute(f"SELECT first_name, last_name, username, {_ts_text('created_ts', 'created_at')} FROM users WHERE user_id = ?", (user_id,))
+        return cursor.fetchone()
 
-def get_all_users():
-    """Barcha foydalanuvchilarni qaytaradi."""
-    with sqlite3.connect(DB_NAME) as conn:
+def get_user_ids_page(after_user_id=0, limit=1000):
+    """user_id > after_user_id bo'lgan keyingi sahifadagi faol foydalanuvchi ID'larini qaytaradi (keyset)."""
+    with read_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM users")
-        return cursor.fetchall()
+        cursor.execute("SELECT user_id FROM users WHERE is_active = 1 AND user_id > ? ORDER BY user_id LIMIT ?", (after_user_id, limit))
+        return [row[0] for row in cursor.fetchall()]
 
 def is_file_code_exists(file_code):
     """Fayl kodi mavjudligini tekshiradi."""
-    with sqlite3.connect(DB_NAME) as conn:
+    with read_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("SELECT COUNT(*) FROM files WHERE file_code = ?", (file_code,))
         return cursor.fetchone()[0] > 0
@@ -85,101 +436,598 @@ def add_file(file_code, file_id=None, file_link=None, file_type=None, caption=No
     """Faylni qo'shadi."""
     if is_file_code_exists(file_code):
         return False
-    with sqlite3.connect(DB_NAME) as conn:
+    with write_connection() as conn:
         cursor = conn.cursor()
-        uploaded_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        uploaded_ts = int(time.time())
         try:
-            cursor.execute('''INSERT INTO files (file_code, file_id, file_link, file_type, caption, uploaded_at) 
+            cursor.execute('''INSERT INTO files (file_code, file_id, file_link, file_type, caption, uploaded_ts) 
                               VALUES (?, ?, ?, ?, ?, ?)''', 
-                           (file_code, file_id, file_link, file_type, caption, uploaded_at))
+                           (file_code, file_id, file_link, file_type, caption, uploaded_ts))
             conn.commit()
+            file_cache.invalidate(file_code)
+            _file_count_cache.clear()
             return True
         except sqlite3.Error as e:
             logging.error(f"Fayl qo‘shishda xatolik: {e}")
             return False
 
+def add_files_bulk(rows):
+    """Bir nechta faylni bitta tranzaksiyada qo'shadi.
+
+    rows: (file_code, file_id, file_type, caption) ro'yxati. Bazada allaqachon bor kodlar
+    bitta so'rov bilan aniqlanadi va o'tkazib yuboriladi; ular to'plam sifatida qaytariladi.
+    """
+    codes = json.dumps([row[0] for row in rows])
+    uploaded_ts = int(time.time())
+    with write_connection() as conn:
+        existing = {code for code, in conn.execute(
+            "SELECT file_code FROM files WHERE file_code IN (SELECT value FROM json_each(?))", (codes,))}
+        new_rows = [row for row in rows if row[0] not in existing]
+        conn.executemany('''INSERT INTO files (file_code, file_id, file_type, caption, uploaded_ts)
+                              VALUES (?, ?, ?, ?, ?)''',
+                         [row + (uploaded_ts,) for row in new_rows])
+    for row in new_rows:
+        file_cache.invalidate(row[0])
+    _file_count_cache.clear()
+    return existing
+
+# files.file_type qiymati: kod file_items dagi bir nechta faylga ishora qiladi
+ALBUM_TYPE = "album"
+
+def add_file_group(file_code, items, caption=None):
+    """Bir nechta fayldan iborat kodni qo'shadi. items: tartiblangan (file_id, file_type, caption) ro'yxati."""
+    uploaded_ts = int(time.time())
+    with write_connection() as conn:
+        inserted = conn.execute('''INSERT INTO files (file_code, file_type, caption, uploaded_ts) VALUES (?, ?, ?, ?)
+                                  ON CONFLICT(file_code) DO NOTHING''',
+                                (file_code, ALBUM_TYPE, caption, uploaded_ts)).rowcount
+        if not inserted:
+            return False
+        conn.executemany("INSERT INTO file_items (file_code, position, file_id, file_type, caption) VALUES (?, ?, ?, ?, ?)",
+                         [(file_code, position) + tuple(item) for position, item in enumerate(items)])
+    file_cache.invalidate(file_code)
+    _file_count_cache.clear()
+    return True
+
 def get_file(file_code):
-    """Fayl ma'lumotlarini qaytaradi."""
-    with sqlite3.connect(DB_NAME) as conn:
+    """Fayl ma'lumotlarini qaytaradi (avval keshdan)."""
+    cached = file_cache.get(file_code, _NOT_CACHED)
+    if cached is not _NOT_CACHED:
+        return cached
+    return load_file(file_code)
+
+def load_file(file_code):
+    """Fayl ma'lumotlarini bazadan o'qib, keshga yozadi (o'qish paytida kod o'zgargan bo'lsa yozmaydi)."""
+    version = file_cache.version()
+    with read_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT file_id, file_link, file_type, caption FROM files WHERE file_code = ?", (file_code,))
-        return cursor.fetchone()
+        # Albom fayllari ham shu so'rovning o'zida olinadi
+        cursor.execute(
+            """SELECT file_id, file_link, file_type, caption,
+                      CASE WHEN file_type = ?2 THEN (
+                          SELECT json_group_array(json_array(file_id, file_type, caption))
+                          FROM (SELECT file_id, file_type, caption FROM file_items WHERE file_code = ?1 ORDER BY position))
+                      END
+               FROM files WHERE file_code = ?1""", (file_code, ALBUM_TYPE))
+        row = cursor.fetchone()
+    file_data = row[:4] + ([tuple(item) for item in json.loads(row[4])] if row[4] else None,) if row else None
+    file_cache.set(file_code, file_data, version)
+    return file_data
 
 def remove_file(file_code):
     """Faylni kod bo'yicha o'chiradi."""
-    with sqlite3.connect(DB_NAME) as conn:
+    with write_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("DELETE FROM files WHERE file_code = ?", (file_code,))
+        conn.execute("DELETE FROM file_items WHERE file_code = ?", (file_code,))
         conn.commit()
+        file_cache.invalidate(file_code)
+        _file_count_cache.clear()
         return cursor.rowcount > 0
 
 def add_channel(channel_username):
     """Majburiy obuna kanalini qo'shadi."""
-    with sqlite3.connect(DB_NAME) as conn:
+    with write_connection() as conn:
         cursor = conn.cursor()
         try:
             cursor.execute("INSERT INTO channels (username) VALUES (?)", (channel_username.lstrip('@'),))
             conn.commit()
+            _invalidate_channels()
             return True
         except sqlite3.IntegrityError:
             return False
 
 def remove_channel(channel_username):
     """Majburiy obuna kanalini o'chiradi."""
-    with sqlite3.connect(DB_NAME) as conn:
+    with write_connection() as conn:
         cursor = conn.cursor()
         cursor.execute("DELETE FROM channels WHERE username = ?", (channel_username.lstrip('@'),))
+        removed = cursor.rowcount > 0
+        cursor.execute("DELETE FROM channel_members WHERE channel = ?", (channel_username.lstrip('@'),))
         conn.commit()
-        return cursor.rowcount > 0
+        _invalidate_channels()
+        return removed
 
 def get_channels():
-    """Barcha majburiy obuna kanallarini qaytaradi."""
-    with sqlite3.connect(DB_NAME) as conn:
+    """Barcha majburiy obuna kanallarini qaytaradi (xotiradagi nusxadan)."""
+    global _channels_cache
+    channels = _channels_cache
+    if channels is None:
+        version = _channels_version
+        with read_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT username FROM channels")
+            channels = [row[0] for row in cursor.fetchall()]
+        with _channels_lock:
+            # O'qish paytida kanallar o'zgargan bo'lsa, eskirgan ro'yxat keshga yozilmaydi
+            if version == _channels_version:
+                _channels_cache = channels
+    return list(channels)
+
+def _invalidate_channels():
+    global _channels_cache, _channels_version
+    with _channels_lock:
+        _channels_cache = None
+        _channels_version += 1
+
+def set_channel_member(channel, user_id, is_member):
+    """Kanal a'zoligi holatini saqlaydi yoki yangilaydi."""
+    with write_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT username FROM channels")
-        return [row[0] for row in cursor.fetchall()]
+        updated_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        cursor.execute('''INSERT OR REPLACE INTO channel_members (channel, user_id, is_member, updated_at)
+                          VALUES (?, ?, ?, ?)''',
+                       (channel, user_id, int(is_member), updated_at))
+        conn.commit()
+
+def get_channel_members():
+    """Saqlangan barcha kanal a'zoligi holatlarini qaytaradi."""
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT channel, user_id, is_member, updated_at FROM channel_members")
+        return cursor.fetchall()
+
+def clear_channel_members(channel):
+    """Kanal bo'yicha saqlangan a'zolik holatlarini o'chiradi."""
+    with write_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM channel_members WHERE channel = ?", (channel,))
+        conn.commit()
 
 # Yangi funksiya: Fayl so‘rovini qo‘shish
 def add_file_request(user_id, file_code):
     """Foydalanuvchi fayl so‘rovini qo‘shadi."""
-    with sqlite3.connect(DB_NAME) as conn:
+    with write_connection() as conn:
         cursor = conn.cursor()
-        requested_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        requested_ts = int(time.time())
         try:
-            cursor.execute('''INSERT INTO file_requests (user_id, file_code, requested_at) 
+            cursor.execute('''INSERT INTO file_requests (user_id, file_code, requested_ts) 
                               VALUES (?, ?, ?)''', 
-                           (user_id, file_code, requested_at))
+                           (user_id, file_code, requested_ts))
+            _update_request_rollups(conn, [(user_id, file_code, requested_ts)])
             conn.commit()
             return True
         except sqlite3.Error as e:
             logging.error(f"Fayl so‘rovi qo‘shishda xatolik: {e}")
             return False
 
+def add_file_requests_bulk(rows):
+    """Bir nechta fayl so‘rovini bitta tranzaksiyada qo'shadi va yig'ma jadvallarni yangilaydi.
+
+    rows: (user_id, file_code, requested_ts) ro'yxati.
+    """
+    with write_connection() as conn:
+        conn.executemany('''INSERT INTO file_requests (user_id, file_code, requested_ts)
+                              VALUES (?, ?, ?)''', rows)
+        _update_request_rollups(conn, rows)
+
+def _update_request_rollups(conn, rows, totals=True, hourly=True):
+    """So'rovlar partiyasini xotirada jamlab, har bir kalit uchun bitta upsert bilan yozadi.
+
+    totals — foydalanuvchi/kunlik yig'malar va jami hisoblagich, hourly — soatlik yig'ma.
+    """
+    by_user = {}
+    by_day_code = {}
+    by_hour_code = {}
+    for user_id, file_code, requested_ts in rows:
+        count, last_ts = by_user.get(user_id, (0, 0))
+        by_user[user_id] = (count + 1, max(last_ts, requested_ts or 0))
+        if requested_ts is None:
+            continue  # vaqti o'qib bo'lmaydigan eski qator: faqat sonlarga kiradi
+        key = (_local_day(requested_ts), file_code)
+        by_day_code[key] = by_day_code.get(key, 0) + 1
+        key = (requested_ts - requested_ts % 3600, file_code)
+        by_hour_code[key] = by_hour_code.get(key, 0) + 1
+    if totals:
+        conn.executemany('''INSERT INTO user_request_counts (user_id, request_count, last_requested_ts) VALUES (?, ?, ?)
+                              ON CONFLICT(user_id) DO UPDATE SET
+                                  request_count = request_count + excluded.request_count,
+                                  last_requested_ts = MAX(COALESCE(last_requested_ts, 0), excluded.last_requested_ts)''',
+                         [(user_id, count, last_ts or None) for user_id, (count, last_ts) in by_user.items()])
+        conn.executemany('''INSERT INTO daily_code_requests (day, file_code, request_count) VALUES (?, ?, ?)
+                              ON CONFLICT(day, file_code) DO UPDATE SET request_count = request_count + excluded.request_count''',
+                         [(day, file_code, count) for (day, file_code), count in by_day_code.items()])
+        conn.execute("UPDATE counters SET value = value + ? WHERE name = 'file_requests'", (len(rows),))
+    if hourly:
+        conn.executemany('''INSERT INTO hourly_code_requests (hour_ts, file_code, request_count) VALUES (?, ?, ?)
+                              ON CONFLICT(hour_ts, file_code) DO UPDATE SET request_count = request_count + excluded.request_count''',
+                         [(hour_ts, file_code, count) for (hour_ts, file_code), count in by_hour_code.items()])
+
+# Migratsiyadan oldingi so'rovlarni yig'malarga fonda qo'shadigan vazifalar: {nomi: _update_request_rollups parametrlari}
+ROLLUP_BACKFILLS = {
+    "rollups": {"totals": True, "hourly": False},
+    "hourly_rollups": {"totals": False, "hourly": True},
+}
+
+def seed_rollups_batch(name, after_id, batch_size):
+    """id oralig'idagi eski so'rovlarni yig'ma jadvallarga qo'shadi va holatni saqlaydi. Qisqa tranzaksiya."""
+    with write_connection() as conn:
+        rows = conn.execute(
+            f"""SELECT user_id, file_code, {_REQUEST_TS} FROM file_requests
+                WHERE id > ? AND id <= ? AND id <= (SELECT max_id FROM backfill_progress WHERE name = ?)""",
+            (after_id, after_id + batch_size, name)).fetchall()
+        if rows:
+            _update_request_rollups(conn, rows, **ROLLUP_BACKFILLS[name])
+        _set_backfill_progress(conn, name, after_id + batch_size)
+        return len(rows)
+
+def _local_day(ts):
+    return time.strftime("%Y-%m-%d", time.localtime(ts))
+
+def local_day_start(ts):
+    """ts tushgan mahalliy kun boshining epoch vaqti."""
+    t = time.localtime(ts)
+    return int(time.mktime((t.tm_year, t.tm_mon, t.tm_mday, 0, 0, 0, 0, 0, -1)))
+
 # Yangi funksiya: Foydalanuvchi so‘rovlarini olish
+def user_requests_filter(user_id, start_date=None, end_date=None):
+    """file_requests uchun (WHERE sharti, parametrlar); idx_file_requests_user_ts indeksiga mos."""
+    where = "user_id = ?"
+    params = [user_id]
+    if start_date:
+        where += " AND requested_ts >= ?"
+        params.append(to_epoch(start_date))
+    if end_date:
+        where += " AND requested_ts <= ?"
+        params.append(to_epoch(end_date))
+    return where, params
+
+def user_requests_union(user_id, start_date=None, end_date=None):
+    """Xom so'rovlar va siqilgan kunlik yig'malarni birlashtiruvchi SELECT va parametrlar.
+
+    Ustunlar: file_code, requested_at (matn), request_count, sort_ts. Siqilgan kunlar uchun
+    vaqt o'rnida sana turadi va sana filtri kun aniqligida qo'llanadi.
+    """
+    where, params = user_requests_filter(user_id, start_date, end_date)
+    compacted_where = "user_id = ?"
+    compacted_params = [user_id]
+    if start_date:
+        compacted_where += " AND day >= ?"
+        compacted_params.append(start_date[:10])
+    if end_date:
+        compacted_where += " AND day <= ?"
+        compacted_params.append(end_date[:10])
+    return (f"""SELECT file_code, {_ts_text('requested_ts', 'requested_at')} AS requested_at, 1 AS request_count,
+                       requested_ts AS sort_ts
+                FROM file_requests WHERE {where}
+                UNION ALL
+                SELECT file_code, day, request_count, last_ts FROM daily_user_code_requests WHERE {compacted_where}""",
+            params + compacted_params)
+
 def get_user_requests(user_id, start_date=None, end_date=None):
-    """Foydalanuvchining barcha fayl so‘rovlarini qaytaradi, vaqt filtri bilan."""
-    with sqlite3.connect(DB_NAME) as conn:
+    """Foydalanuvchining barcha fayl so‘rovlarini qaytaradi, vaqt filtri bilan.
+
+    Qatorlar: (kod, vaqt, soni) — xom so'rovlar uchun soni 1, siqilgan kunlar uchun vaqt o'rnida sana.
+    """
+    union, params = user_requests_union(user_id, start_date, end_date)
+    with read_connection() as conn:
         cursor = conn.cursor()
-        query = "SELECT file_code, requested_at FROM file_requests WHERE user_id = ?"
-        params = [user_id]
-        if start_date:
-            query += " AND requested_at >= ?"
-            params.append(start_date)
-        if end_date:
-            query += " AND requested_at <= ?"
-            params.append(end_date)
-        cursor.execute(query, params)
+        cursor.execute(f"SELECT file_code, requested_at, request_count FROM ({union}) ORDER BY sort_ts DESC", params)
         return cursor.fetchall()
 
-# database.py faylining oxiriga qo‘shiladi
-def get_all_file_codes(file_type=None):
-    """Barcha fayl kodlarni yoki faqat ma'lum turdagi kodlarni qaytaradi."""
-    with sqlite3.connect(DB_NAME) as conn:
+def get_user_request_stats(user_id, start_date=None, end_date=None, recent_limit=5, top_codes=5):
+    """Foydalanuvchi so‘rovlari statistikasini SQL tomonida hisoblaydi.
+
+    Qaytaradi: {"count": jami, "recent": [(kod, vaqt), ...] eng so'nggilari,
+    "by_code": [(kod, soni), ...] eng ko'p so'ralganlari}. Siqilgan eski so'rovlar ham hisobga olinadi.
+    """
+    union, params = user_requests_union(user_id, start_date, end_date)
+    with read_connection() as conn:
         cursor = conn.cursor()
-        if file_type:
-            cursor.execute("SELECT file_code, file_type, uploaded_at, caption FROM files WHERE file_type = ? ORDER BY uploaded_at DESC", (file_type,))
+        if start_date or end_date:
+            count = cursor.execute(f"SELECT COALESCE(SUM(request_count), 0) FROM ({union})", params).fetchone()[0]
         else:
-            cursor.execute("SELECT file_code, file_type, uploaded_at, caption FROM files ORDER BY uploaded_at DESC")
-        return cursor.fetchall()
+            row = cursor.execute("SELECT request_count FROM user_request_counts WHERE user_id = ?", (user_id,)).fetchone()
+            count = row[0] if row else 0
+        cursor.execute(
+            f"SELECT file_code, requested_at FROM ({union}) ORDER BY sort_ts DESC LIMIT ?", params + [recent_limit])
+        recent = cursor.fetchall()
+        cursor.execute(
+            f"""SELECT file_code, SUM(request_count) AS total FROM ({union})
+                GROUP BY file_code ORDER BY total DESC, file_code LIMIT ?""", params + [top_codes])
+        by_code = cursor.fetchall()
+    return {"count": count, "recent": recent, "by_code": by_code}
+
+def create_broadcast_job(content_type, method, args, kwargs, admin_chat_id=None):
+    """Yangi reklama vazifasini yaratadi va uning ID sini qaytaradi.
+
+    method — Bot metodi nomi (masalan, "send_photo"), args/kwargs — unga uzatiladigan qiymatlar.
+    """
+    now = int(time.time())
+    with write_connection() as conn:
+        cursor = conn.execute('''INSERT INTO broadcast_jobs (content_type, method, args, kwargs, admin_chat_id, created_ts, updated_ts)
+                                 VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                              (content_type, method, json.dumps(list(args)), json.dumps(kwargs), admin_chat_id, now, now))
+        return cursor.lastrowid
+
+def get_next_broadcast_job():
+    """Bajarilmagan (kutayotgan yoki to'xtab qolgan) eng eski vazifani qaytaradi."""
+    with read_connection() as conn:
+        row = conn.execute('''SELECT id, content_type, method, args, kwargs, admin_chat_id, last_user_id, sent, blocked, failed
+                              FROM broadcast_jobs WHERE status IN ('pending', 'running') ORDER BY id LIMIT 1''').fetchone()
+    if row is None:
+        return None
+    job_id, content_type, method, args, kwargs, admin_chat_id, last_user_id, sent, blocked, failed = row
+    return {
+        "id": job_id,
+        "content_type": content_type,
+        "method": method,
+        "args": json.loads(args),
+        "kwargs": json.loads(kwargs),
+        "admin_chat_id": admin_chat_id,
+        "last_user_id": last_user_id,
+        "stats": {"sent": sent, "blocked": blocked, "failed": failed},
+    }
+
+def set_broadcast_job_status(job_id, status):
+    with write_connection() as conn:
+        conn.execute("UPDATE broadcast_jobs SET status = ?, updated_ts = ? WHERE id = ?", (status, int(time.time()), job_id))
+
+def save_broadcast_checkpoint(job_id, last_user_id, stats):
+    """Oxirgi to'liq qayta ishlangan foydalanuvchini va hisoblagichlarni saqlaydi."""
+    with write_connection() as conn:
+        conn.execute('''UPDATE broadcast_jobs SET last_user_id = ?, sent = ?, blocked = ?, failed = ?, updated_ts = ?
+                        WHERE id = ?''',
+                     (last_user_id, stats["sent"], stats["blocked"], stats["failed"], int(time.time()), job_id))
+
+def count_files(file_type=None):
+    """Fayllar sonini qaytaradi (xotirada saqlanadi, fayl qo'shilsa/o'chirilsa yangilanadi)."""
+    count = _file_count_cache.get(file_type)
+    if count is None:
+        version = _file_count_cache.version()
+        with read_connection() as conn:
+            if file_type:
+                count = conn.execute("SELECT COUNT(*) FROM files WHERE file_type = ?", (file_type,)).fetchone()[0]
+            else:
+                count = conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        _file_count_cache.set(file_type, count, version)
+    return count
+
+def get_file_codes_page(file_type=None, cursor=None, backward=False, limit=10):
+    """Fayl kodlarining bitta sahifasini qaytaradi (yangilari birinchi).
+
+    Keyset sahifalash: cursor — (uploaded_ts, id); backward=False bo'lsa undan keyingi,
+    True bo'lsa undan oldingi sahifa. Qatorlar: (kod, tur, yuklangan vaqt, izoh, uploaded_ts, id).
+    """
+    conditions = []
+    params = []
+    if file_type:
+        conditions.append("file_type = ?")
+        params.append(file_type)
+    if cursor:
+        conditions.append("(uploaded_ts, id) > (?, ?)" if backward else "(uploaded_ts, id) < (?, ?)")
+        params.extend(cursor)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    order = "ASC" if backward else "DESC"
+    with read_connection() as conn:
+        rows = conn.execute(
+            f"""SELECT file_code, file_type, {_ts_text('uploaded_ts', 'uploaded_at')}, caption, uploaded_ts, id
+                FROM files {where} ORDER BY uploaded_ts {order}, id {order} LIMIT ?""",
+            params + [limit]).fetchall()
+    if backward:
+        rows.reverse()
+    return rows
+
+def get_fsm_keys(min_updated_ts):
+    """Muddati o'tmagan FSM yozuvlarining (chat_id, user_id, updated_ts) ro'yxati."""
+    with read_connection() as conn:
+        return conn.execute("SELECT chat_id, user_id, updated_ts FROM fsm_states WHERE updated_ts >= ?",
+                            (min_updated_ts,)).fetchall()
+
+def get_fsm_record(chat_id, user_id):
+    """(state, data JSON, updated_ts) yoki None."""
+    with read_connection() as conn:
+        return conn.execute("SELECT state, data, updated_ts FROM fsm_states WHERE chat_id = ? AND user_id = ?",
+                            (chat_id, user_id)).fetchone()
+
+def save_fsm_record(chat_id, user_id, state, data, updated_ts):
+    """FSM yozuvini saqlaydi; holat ham, ma'lumot ham bo'sh bo'lsa o'chiradi."""
+    with write_connection() as conn:
+        if state is None and data is None:
+            conn.execute("DELETE FROM fsm_states WHERE chat_id = ? AND user_id = ?", (chat_id, user_id))
+        else:
+            conn.execute('''INSERT INTO fsm_states (chat_id, user_id, state, data, updated_ts) VALUES (?, ?, ?, ?, ?)
+                            ON CONFLICT(chat_id, user_id) DO UPDATE SET
+                                state = excluded.state, data = excluded.data, updated_ts = excluded.updated_ts''',
+                         (chat_id, user_id, state, data, updated_ts))
+
+def delete_expired_fsm_states(min_updated_ts):
+    """Uzoq vaqt faol bo'lmagan FSM yozuvlarini o'chiradi va ularning sonini qaytaradi."""
+    with write_connection() as conn:
+        return conn.execute("DELETE FROM fsm_states WHERE updated_ts < ?", (min_updated_ts,)).rowcount
+
+def get_request_totals(days=7):
+    """Jami so'rovlar va oxirgi `days` kundagi kunlik so'rovlar: {"total": N, "daily": [(kun, soni), ...]}."""
+    first_day = _local_day(time.time() - (days - 1) * 86400)
+    with read_connection() as conn:
+        daily = conn.execute(
+            """SELECT day, SUM(request_count) FROM daily_code_requests
+               WHERE day >= ? GROUP BY day ORDER BY day DESC""", (first_day,)).fetchall()
+    return {"total": get_counter("file_requests"), "daily": daily}
+
+# So'rov vaqti: backfill tugamagan qatorlar uchun eski TEXT ustundan
+_REQUEST_TS = "COALESCE(requested_ts, CAST(strftime('%s', requested_at, 'utc') AS INTEGER))"
+
+def _rollup_sources(with_compacted):
+    """Yig'ma jadvallarni qayta hisoblash manbalari: [(jadval, kalit ustunlar, SELECT), ...].
+
+    with_compacted bo'lsa siqilgan kunlik yig'ma (daily_user_code_requests) ham hisobga olinadi;
+    soatlik yig'ma faqat xom qatorlardan quriladi (siqilgan davr uchun u ham tozalanadi).
+    """
+    requests = f"SELECT user_id, file_code, {_REQUEST_TS} AS ts, 1 AS n FROM file_requests"
+    if with_compacted:
+        requests += " UNION ALL SELECT user_id, file_code, last_ts, request_count FROM daily_user_code_requests"
+    return [
+        ("counters", ("name",),
+         f"""SELECT 'users' AS name, COUNT(*) AS value FROM users
+             UNION ALL SELECT 'active_users', COUNT(*) FROM users WHERE is_active = 1
+             UNION ALL SELECT 'file_requests', COALESCE(SUM(n), 0) FROM ({requests})"""),
+        ("user_request_counts", ("user_id",),
+         f"""SELECT user_id, SUM(n) AS request_count, MAX(ts) AS last_requested_ts
+             FROM ({requests}) GROUP BY user_id"""),
+        ("daily_code_requests", ("day", "file_code"),
+         f"""SELECT date(ts, 'unixepoch', 'localtime') AS day, file_code, SUM(n) AS request_count
+             FROM ({requests}) WHERE ts IS NOT NULL GROUP BY day, file_code"""),
+        ("hourly_code_requests", ("hour_ts", "file_code"),
+         f"""SELECT ts - ts % 3600 AS hour_ts, file_code, COUNT(*) AS request_count
+             FROM (SELECT {_REQUEST_TS} AS ts, file_code FROM file_requests)
+             WHERE ts IS NOT NULL GROUP BY hour_ts, file_code"""),
+    ]
+
+def _rebuild_rollups(cursor):
+    """Yig'ma jadvallarni qayta hisoblaydi; har bir jadvalda noto'g'ri yoki ortiqcha bo'lgan qatorlar sonini qaytaradi."""
+    differences = {}
+    with_compacted = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_user_code_requests'").fetchone() is not None
+    for table, keys, select in _rollup_sources(with_compacted):
+        cursor.execute(f"CREATE TEMP TABLE rebuilt AS {select}")
+        columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+        column_list = ", ".join(columns)
+        key_list = ", ".join(keys)
+        cursor.execute(f"""SELECT (SELECT COUNT(*) FROM (SELECT * FROM rebuilt EXCEPT SELECT {column_list} FROM {table}))
+                                + (SELECT COUNT(*) FROM {table} WHERE ({key_list}) NOT IN (SELECT {key_list} FROM rebuilt))""")
+        differences[table] = cursor.fetchone()[0]
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(f"INSERT INTO {table} ({column_list}) SELECT * FROM rebuilt")
+        cursor.execute("DROP TABLE rebuilt")
+    return differences
+
+def rebuild_rollups():
+    """Statistika yig'malarini xom jadvallardan qayta quradi (moslikni tekshirish uchun).
+
+    Qaytaradi: {jadval: oldingi qiymatlardan farq qilgan qatorlar soni}.
+    """
+    with write_connection() as conn:
+        differences = _rebuild_rollups(conn.cursor())
+        # Yig'malar to'liq qurildi: tugamagan fon to'ldirishlari ularni ikki marta sanamasligi kerak
+        conn.executemany("UPDATE backfill_progress SET next_id = max_id WHERE name = ?",
+                         [(name,) for name in ROLLUP_BACKFILLS])
+        return differences
+
+# Top fayllar hisoboti davrlari (soniya)
+TOP_PERIODS = {"hour": 3600, "day": 86400, "week": 7 * 86400}
+
+def get_top_codes(period, limit=10):
+    """Oxirgi davrda eng ko'p so'ralgan kodlar: [(kod, soni), ...].
+
+    Soatlik yig'madan o'qiladi. Davr boshi tushgan soat faqat davr ichidagi ulushi bilan
+    hisoblanadi (so'rovlar soat ichida tekis taqsimlangan deb olinadi), shuning uchun
+    "oxirgi soat" haqiqatan ~60 daqiqani qamraydi, 119 emas.
+    """
+    now = int(time.time())
+    since = now - TOP_PERIODS[period]
+    first_hour = since - since % 3600
+    first_weight = (first_hour + 3600 - since) / 3600
+    with read_connection() as conn:
+        return conn.execute(
+            """SELECT file_code, CAST(ROUND(SUM(request_count * CASE WHEN hour_ts = ? THEN ? ELSE 1 END)) AS INTEGER) AS total
+               FROM hourly_code_requests
+               WHERE hour_ts >= ? GROUP BY file_code HAVING total > 0
+               ORDER BY total DESC, file_code LIMIT ?""",
+            (first_hour, first_weight, first_hour, limit)).fetchall()
+
+def get_code_histogram(file_code, hours=24):
+    """Kodning oxirgi `hours` soatdagi soatlik so'rovlari: [(hour_ts, soni), ...], bo'sh soatlar 0 bilan."""
+    now = int(time.time())
+    current_hour = now - now % 3600
+    first_hour = current_hour - (hours - 1) * 3600
+    with read_connection() as conn:
+        counts = dict(conn.execute(
+            """SELECT hour_ts, request_count FROM hourly_code_requests
+               WHERE file_code = ? AND hour_ts >= ?""", (file_code, first_hour)).fetchall())
+    return [(hour_ts, counts.get(hour_ts, 0)) for hour_ts in range(first_hour, current_hour + 1, 3600)]
+
+def find_compaction_boundary(cutoff_ts):
+    """requested_ts >= cutoff_ts bo'lgan birinchi qatorning taxminiy id si.
+
+    id lar vaqt bo'yicha o'sib boradi, shuning uchun requested_ts indeksisiz ikkilik qidiruv
+    yetarli: O(log n) ta nuqtaviy o'qish.
+    """
+    with read_connection() as conn:
+        return _first_request_id_since(conn, cutoff_ts)
+
+def _first_request_id_since(conn, since_ts):
+    low, high = conn.execute("SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), 0) + 1 FROM file_requests").fetchone()
+    while low < high:
+        middle = (low + high) // 2
+        row = conn.execute(f"SELECT {_REQUEST_TS} FROM file_requests WHERE id >= ? ORDER BY id LIMIT 1",
+                           (middle,)).fetchone()
+        if row is None or (row[0] is not None and row[0] >= since_ts):
+            high = middle
+        else:
+            low = middle + 1
+    return low
+
+def compact_file_requests_batch(after_id, before_id, cutoff_ts, batch_size):
+    """Bir partiya eski so'rovni kunlik yig'maga qo'shib, xom qatorlarini o'chiradi. Qisqa tranzaksiya.
+
+    Qaytaradi: (oxirgi ko'rilgan id yoki None, siqilgan qatorlar soni).
+    """
+    with write_connection() as conn:
+        rows = conn.execute(
+            """SELECT id, user_id, file_code, requested_ts FROM file_requests
+               WHERE id > ? AND id < ? ORDER BY id LIMIT ?""", (after_id, before_id, batch_size)).fetchall()
+        if not rows:
+            return None, 0
+        old = [row for row in rows if row[3] is not None and row[3] < cutoff_ts]
+        aggregates = {}
+        for _, user_id, file_code, requested_ts in old:
+            key = (user_id, _local_day(requested_ts), file_code)
+            count, first_ts, last_ts = aggregates.get(key, (0, requested_ts, requested_ts))
+            aggregates[key] = (count + 1, min(first_ts, requested_ts), max(last_ts, requested_ts))
+        conn.executemany('''INSERT INTO daily_user_code_requests (user_id, day, file_code, request_count, first_ts, last_ts)
+                              VALUES (?, ?, ?, ?, ?, ?)
+                              ON CONFLICT(user_id, day, file_code) DO UPDATE SET
+                                  request_count = request_count + excluded.request_count,
+                                  first_ts = MIN(first_ts, excluded.first_ts),
+                                  last_ts = MAX(last_ts, excluded.last_ts)''',
+                         [key + value for key, value in aggregates.items()])
+        conn.executemany("DELETE FROM file_requests WHERE id = ?", [(row[0],) for row in old])
+        return rows[-1][0], len(old)
+
+def prune_hourly_rollups(cutoff_ts):
+    """Saqlash muddatidan eski soatlik yig'malarni o'chiradi."""
+    with write_connection() as conn:
+        return conn.execute("DELETE FROM hourly_code_requests WHERE hour_ts < ?", (cutoff_ts - cutoff_ts % 3600,)).rowcount
+
+def incremental_vacuum(pages):
+    """Ko'pi bilan pages ta bo'sh sahifani fayldan qaytaradi.
+
+    Qaytaradi: (bo'shatilgan sahifalar, qolgan bo'sh sahifalar) yoki baza auto_vacuum = INCREMENTAL
+    rejimida bo'lmasa None (yangi bazalar shunday yaratiladi, eskilari — enable_incremental_vacuum bilan).
+    """
+    with write_connection() as conn:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return None
+        before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        # execute() pragmani faqat bir qadam bajaradi (bitta sahifa); executescript oxirigacha yuritadi
+        conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+        after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return before - after, after
 
-create_tables()
+def enable_incremental_vacuum():
+    """Mavjud bazani auto_vacuum = INCREMENTAL rejimiga o'tkazadi (bir martalik to'liq VACUUM)."""
+    with write_connection() as conn:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        return conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
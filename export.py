@@ -0,0 +1,113 @@
+"""Foydalanuvchilar eksporti (Excel/CSV).
+
+Eksport alohida jarayonda bajariladi: qatorlar faqat o'qish uchun ochilgan
+ulanishdan bo'laklab o'qiladi va doimiy xotira talab qiladigan yozuvchiga
+(openpyxl write-only yoki gzip CSV) uzatiladi. Natija vaqtinchalik noyob
+faylga yoziladi; uni yuborgandan keyin chaqiruvchi o'chiradi.
+"""
+import asyncio
+import csv
+import gzip
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from database import DB_NAME, _ts_text, user_requests_union
+
+CHUNK_SIZE = 5000
+
+def _user_requests_query(user_id, start_date=None, end_date=None):
+    union, params = user_requests_union(user_id, start_date, end_date)
+    return f"SELECT file_code, requested_at, request_count FROM ({union}) ORDER BY sort_ts DESC", params
+
+# tur -> (fayl nomi, sarlavhalar, SQL yoki (parametrlar) -> (SQL, qiymatlar))
+EXPORTS = {
+    # Foydalanuvchilar ro'yxati
+    "users": (
+        "users",
+        ["ID", "Telegram ID", "Ism", "Familiya", "Username", "Ro‘yxatdan o‘tgan vaqt"],
+        f"SELECT id, user_id, first_name, last_name, username, {_ts_text('created_ts', 'created_at')} FROM users ORDER BY id",
+    ),
+    # Bitta foydalanuvchining so'rovlari (filtr bilan; siqilgan kunlar sana va soni bilan)
+    "requests": (
+        "user_requests",
+        ["So‘rov kodi", "So‘rov vaqti", "Soni"],
+        _user_requests_query,
+    ),
+    # Har bir foydalanuvchi va uning so'rovlar soni (oldindan hisoblangan yig'madan)
+    "stats": (
+        "all_users_stats",
+        ["Foydalanuvchi ID", "Ism", "Username", "Ro‘yxatdan o‘tgan", "So‘rovlar soni"],
+        f"""SELECT u.user_id, u.first_name, u.last_name, u.username, {_ts_text('u.created_ts', 'u.created_at')},
+                   COALESCE(c.request_count, 0)
+            FROM users u
+            LEFT JOIN user_request_counts c ON c.user_id = u.user_id
+            ORDER BY u.id""",
+    ),
+}
+
+def _format_stats_row(row):
+    user_id, first_name, last_name, username, created_at, request_count = row
+    return [user_id, f"{first_name} {last_name or ''}", f"@{username or 'Yo‘q'}", created_at, request_count]
+
+ROW_FORMATTERS = {"stats": _format_stats_row}
+
+def _iter_rows(query, params, formatter):
+    conn = sqlite3.connect(f"file:{DB_NAME}?mode=ro", uri=True)
+    try:
+        cursor = conn.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(CHUNK_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                yield formatter(row) if formatter else row
+    finally:
+        conn.close()
+
+def write_export(kind, fmt, params=()):
+    """Eksport faylini yozadi va (yo'l, fayl nomi) ni qaytaradi. Ishchi jarayonda bajariladi."""
+    base_name, header, query = EXPORTS[kind]
+    query, query_params = query(*params) if callable(query) else (query, ())
+    rows = _iter_rows(query, query_params, ROW_FORMATTERS.get(kind))
+    suffix = ".csv.gz" if fmt == "csv" else ".xlsx"
+    fd, path = tempfile.mkstemp(prefix=f"{base_name}_", suffix=suffix)
+    os.close(fd)
+    try:
+        if fmt == "csv":
+            with gzip.open(path, "wt", encoding="utf-8-sig", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(header)
+                writer.writerows(rows)
+        else:
+            from openpyxl import Workbook
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet()
+            sheet.append(header)
+            for row in rows:
+                sheet.append(row)
+            workbook.save(path)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, base_name + suffix
+
+_executor = None
+
+async def run_in_worker(func, *args):
+    """Modul darajasidagi funksiyani alohida jarayonda bajaradi; event loop bloklanmaydi."""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, func, *args)
+
+async def export_to_file(kind, fmt="xlsx", params=()):
+    """Eksportni alohida jarayonda bajaradi."""
+    return await run_in_worker(write_export, kind, fmt, tuple(params))
+
+def shutdown():
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
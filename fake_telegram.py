@@ -0,0 +1,148 @@
+"""Lokal test uchun soxta Telegram: webhook manziliga sun'iy update'lar yuboradi.
+
+Bot webhook rejimida (BOT_MODE=webhook, WEBHOOK_URL bo'sh, LOCAL_BOT_API_URL=http://127.0.0.1:8081)
+ishga tushirilgach:
+
+    python fake_telegram.py --count 5000 --concurrency 50 --users 200
+
+Har bir update — oddiy foydalanuvchidan kelgan matnli xabar (standart holatda fayl kodi).
+Oxirida javob kodlari, kechikish foizliklari va o'tkazuvchanlik chiqariladi.
+
+Skript LOCAL_BOT_API_URL da soxta Bot API'ni ham ko'taradi: shu o'zgaruvchi berilgan bot
+javoblarini (sendMessage, getChatMember va h.k.) haqiqiy api.telegram.org ga emas, shu yerga
+yuboradi. Shuning uchun minglab soxta chat ID'lar ishlab turgan botni limitlarga urib qo'ymaydi.
+Oxirida bot qaysi API metodlarini necha marta chaqirgani ham chiqariladi.
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+import aiohttp
+from aiohttp import web
+
+from config import WEBHOOK_LISTEN_PORT, WEBHOOK_PATH, WEBHOOK_SECRET, LOCAL_BOT_API_URL
+from webhook import SECRET_HEADER
+
+
+def make_update(update_id, user_id, text):
+    user = {"id": user_id, "is_bot": False, "first_name": f"Test {user_id}", "username": f"test{user_id}"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": user["first_name"]},
+            "from": user,
+            "text": text,
+        },
+    }
+
+
+class FakeBotAPI:
+    """Bot API'ning eng kerakli metodlariga muvaffaqiyatli javob beradigan lokal server."""
+
+    def __init__(self):
+        self.calls = Counter()
+        self.message_ids = itertools.count(1)
+
+    def _message(self, data):
+        message = {
+            "message_id": next(self.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(data.get("chat_id", 0)), "type": "private"},
+        }
+        if "text" in data:
+            message["text"] = data["text"]
+        return message
+
+    def _result(self, method, data):
+        if method == "getme":
+            return {"id": 1, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+        if method == "getchatmember":
+            user_id = int(data.get("user_id", 0))
+            return {"user": {"id": user_id, "is_bot": False, "first_name": f"Test {user_id}"}, "status": "member"}
+        if method == "sendmediagroup":
+            return [self._message(data)]
+        if method.startswith("send") or method.startswith("copy") or method.startswith("forward"):
+            return self._message(data)
+        return True
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        data = dict(await request.post())
+        return web.json_response({"ok": True, "result": self._result(method.lower(), data)})
+
+    async def start(self, base_url):
+        parts = urlsplit(base_url)
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, parts.hostname, parts.port or 80).start()
+        return runner
+
+
+async def run(url, count, concurrency, users, texts, secret, api_url=None):
+    statuses = Counter()
+    latencies = []
+    update_ids = itertools.count(1)
+    headers = {SECRET_HEADER: secret} if secret else {}
+
+    async def sender(session):
+        while True:
+            update_id = next(update_ids)
+            if update_id > count:
+                return
+            update = make_update(update_id, 1_000_000 + random.randrange(users), random.choice(texts))
+            started = time.perf_counter()
+            try:
+                async with session.post(url, json=update, headers=headers) as response:
+                    statuses[response.status] += 1
+            except aiohttp.ClientError as e:
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - started)
+
+    api = FakeBotAPI()
+    runner = await api.start(api_url) if api_url else None
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(sender(session) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    if runner is not None:
+        # Bot oxirgi update'larga javob berib ulgurishi uchun
+        await asyncio.sleep(1)
+        await runner.cleanup()
+
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000
+    print(f"Yuborildi: {count} ta update, {elapsed:.2f} s ({count / elapsed:.0f} update/s)")
+    print("Javoblar: " + ", ".join(f"{status}: {n}" for status, n in sorted(statuses.items(), key=str)))
+    print(f"Kechikish: p50 {percentile(0.5):.1f} ms, p95 {percentile(0.95):.1f} ms, p99 {percentile(0.99):.1f} ms")
+    if runner is not None:
+        print("Bot API chaqiruvlari: " + (", ".join(f"{method}: {n}" for method, n in api.calls.most_common()) or "yo'q"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Webhook'ga soxta Telegram update'larini yuborish")
+    parser.add_argument("--url", default=f"http://127.0.0.1:{WEBHOOK_LISTEN_PORT}{WEBHOOK_PATH}")
+    parser.add_argument("--count", type=int, default=1000, help="update'lar soni")
+    parser.add_argument("--concurrency", type=int, default=40, help="parallel ulanishlar (Telegram max_connections)")
+    parser.add_argument("--users", type=int, default=100, help="turli foydalanuvchilar soni")
+    parser.add_argument("--text", action="append", help="xabar matni (bir necha marta berish mumkin)")
+    parser.add_argument("--secret", default=WEBHOOK_SECRET, help="X-Telegram-Bot-Api-Secret-Token qiymati")
+    parser.add_argument("--api-url", default=LOCAL_BOT_API_URL or "http://127.0.0.1:8081",
+                        help="soxta Bot API manzili (bot LOCAL_BOT_API_URL bilan bir xil)")
+    parser.add_argument("--no-api", action="store_true", help="soxta Bot API'ni ko'tarmaslik")
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.count, args.concurrency, args.users, args.text or ["1", "2", "3"], args.secret,
+                    None if args.no_api else args.api_url))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""FSM holatlarini SQLite'da saqlaydigan aiogram storage.
+
+Holat va ma'lumotlar fsm_states jadvaliga ixcham JSON ko'rinishida yoziladi,
+shuning uchun bot qayta ishga tushganda admin jarayonlari yo'qolmaydi.
+Yozish avval bazaga, keyin xotiradagi kichik LRU keshga tushadi (write-through).
+Qaysi foydalanuvchilarda saqlangan holat borligi xotirada ham kuzatiladi —
+oddiy foydalanuvchilarning har bir xabarida bazaga murojaat qilinmaydi.
+FSM_TTL dan ko'p vaqt faol bo'lmagan holatlar muddati o'tgan hisoblanadi.
+"""
+import asyncio
+import copy
+import json
+import logging
+import time
+
+from aiogram.dispatcher.storage import BaseStorage
+
+import database
+from async_database import run_read, run_write
+from cache import LRUCache
+from config import FSM_TTL, FSM_CACHE_SIZE, DB_MAINTENANCE_INTERVAL
+
+
+class SQLiteStorage(BaseStorage):
+    """Doimiy, hajmi cheklangan FSM storage (bucket'larsiz)."""
+
+    def __init__(self, ttl=FSM_TTL, cache_size=FSM_CACHE_SIZE):
+        self.ttl = ttl
+        # (chat_id, user_id) -> (state, data)
+        self._cache = LRUCache(cache_size)
+        # Saqlangan holati bor kalitlar: (chat_id, user_id) -> oxirgi o'zgarish vaqti (epoch)
+        self._active = {}
+        self._expire_task = None
+
+    async def load(self):
+        """Muddati o'tmagan kalitlarni bazadan o'qiydi va eskilarini tozalash vazifasini boshlaydi."""
+        rows = await run_read(database.get_fsm_keys, int(time.time()) - self.ttl)
+        self._active = {(chat_id, user_id): updated_ts for chat_id, user_id, updated_ts in rows}
+        if DB_MAINTENANCE_INTERVAL > 0 and self._expire_task is None:
+            self._expire_task = asyncio.create_task(self._expire_loop())
+        return len(self._active)
+
+    async def expire(self):
+        """Muddati o'tgan holatlarni bazadan va xotiradan o'chiradi."""
+        cutoff = int(time.time()) - self.ttl
+        deleted = await run_write(database.delete_expired_fsm_states, cutoff)
+        for key in [key for key, updated_ts in self._active.items() if updated_ts < cutoff]:
+            del self._active[key]
+            self._cache.invalidate(key)
+        return deleted
+
+    async def _expire_loop(self):
+        while True:
+            await asyncio.sleep(DB_MAINTENANCE_INTERVAL)
+            try:
+                deleted = await self.expire()
+                if deleted:
+                    logging.info(f"FSM: {deleted} ta eskirgan holat o'chirildi")
+            except Exception as e:
+                logging.error(f"FSM holatlarini tozalashda xatolik: {e}")
+
+    def _key(self, chat, user):
+        chat, user = self.check_address(chat=chat, user=user)
+        return int(chat), int(user)
+
+    async def _load(self, key):
+        """(state, data) ni qaytaradi; ma'lumotni o'zgartirmaslik kerak."""
+        updated_ts = self._active.get(key)
+        if updated_ts is None:
+            return None, {}
+        if updated_ts < time.time() - self.ttl:
+            del self._active[key]
+            self._cache.invalidate(key)
+            return None, {}
+        record = self._cache.get(key)
+        if record is None:
+            row = await run_read(database.get_fsm_record, *key)
+            record = (row[0], json.loads(row[1]) if row[1] else {}) if row else (None, {})
+            self._cache.set(key, record)
+        return record
+
+    async def _save(self, key, state, data):
+        if state is None and not data and key not in self._active:
+            return
+        now = int(time.time())
+        payload = json.dumps(data, ensure_ascii=False, separators=(",", ":")) if data else None
+        await run_write(database.save_fsm_record, *key, state, payload, now)
+        if state is None and not data:
+            self._active.pop(key, None)
+            self._cache.invalidate(key)
+        else:
+            self._active[key] = now
+            self._cache.set(key, (state, data))
+
+    async def get_state(self, *, chat=None, user=None, default=None):
+        state, _ = await self._load(self._key(chat, user))
+        return state if state is not None else self.resolve_state(default)
+
+    async def get_data(self, *, chat=None, user=None, default=None):
+        _, data = await self._load(self._key(chat, user))
+        return copy.deepcopy(data) if data else copy.deepcopy(default or {})
+
+    async def set_state(self, *, chat=None, user=None, state=None):
+        key = self._key(chat, user)
+        _, data = await self._load(key)
+        await self._save(key, self.resolve_state(state), data)
+
+    async def set_data(self, *, chat=None, user=None, data=None):
+        key = self._key(chat, user)
+        state, _ = await self._load(key)
+        await self._save(key, state, copy.deepcopy(data or {}))
+
+    async def update_data(self, *, chat=None, user=None, data=None, **kwargs):
+        key = self._key(chat, user)
+        state, current = await self._load(key)
+        current = copy.deepcopy(current)
+        current.update(data or {}, **kwargs)
+        await self._save(key, state, current)
+
+    async def reset_state(self, *, chat=None, user=None, with_data=True):
+        key = self._key(chat, user)
+        _, data = await self._load(key)
+        await self._save(key, None, {} if with_data else data)
+
+    async def close(self):
+        if self._expire_task is not None:
+            self._expire_task.cancel()
+            self._expire_task = None
+        self._cache.clear()
+
+    async def wait_closed(self):
+        pass
+
+    def stats(self):
+        return {"active": len(self._active), **self._cache.stats()}
@@ -0,0 +1,119 @@
+"""Webhook rejimi: update'larni ichki aiohttp serveri orqali qabul qilish.
+
+Har bir so'rovning X-Telegram-Bot-Api-Secret-Token sarlavhasi tekshiriladi.
+Update fon vazifasida ishlanadi, javob esa darhol qaytariladi. Bir vaqtda
+ishlanayotgan update'lar soni WEBHOOK_MAX_CONCURRENCY bilan cheklangan: limit
+to'lganda yangi so'rov bo'sh joy chiqquncha kutadi. Shunda Telegram ham
+yuborishni sekinlashtiradi va xotirada cheksiz navbat yig'ilmaydi.
+"""
+import asyncio
+import hmac
+import logging
+
+from aiogram import Bot, Dispatcher, types
+from aiohttp import web
+
+from config import (WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_LISTEN_HOST, WEBHOOK_LISTEN_PORT, WEBHOOK_SECRET,
+                    WEBHOOK_MAX_CONCURRENCY, WEBHOOK_MAX_CONNECTIONS, LOCAL_BOT_API_URL)
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """Update'larni qabul qilib, dispatcher'ga cheklangan parallellikda uzatadi."""
+
+    def __init__(self, dp, secret=WEBHOOK_SECRET, max_concurrency=WEBHOOK_MAX_CONCURRENCY):
+        self.dp = dp
+        self.secret = secret
+        self.max_concurrency = max_concurrency
+        self._slots = None
+        self._tasks = set()
+        self.received = 0
+        self.rejected = 0
+        self.failed = 0
+
+    async def handle(self, request):
+        if self.secret and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            self.rejected += 1
+            return web.Response(status=403)
+        try:
+            update = types.Update(**await request.json())
+        except Exception:
+            self.rejected += 1
+            return web.Response(status=400)
+        self.received += 1
+        await self._slots.acquire()
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update):
+        try:
+            Bot.set_current(self.dp.bot)
+            Dispatcher.set_current(self.dp)
+            await self.dp.process_update(update)
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Update {update.update_id} ni ishlashda xatolik: {e}")
+        finally:
+            self._slots.release()
+
+    async def drain(self):
+        """Ishlanayotgan update'lar tugashini kutadi."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self):
+        return {
+            "in_flight": len(self._tasks),
+            "received": self.received,
+            "rejected": self.rejected,
+            "failed": self.failed,
+        }
+
+
+def create_app(dp, server, on_startup=None, on_shutdown=None, allowed_updates=None):
+    """aiohttp ilovasini yaratadi. WEBHOOK_URL bo'sh bo'lsa Telegram'da webhook o'rnatilmaydi (lokal test)."""
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, server.handle)
+
+    async def startup(_):
+        server._slots = asyncio.Semaphore(server.max_concurrency)
+        if on_startup is not None:
+            await on_startup(dp)
+        if WEBHOOK_URL:
+            await dp.bot.set_webhook(
+                WEBHOOK_URL,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=allowed_updates,
+                drop_pending_updates=True,
+                secret_token=WEBHOOK_SECRET or None,
+            )
+            logger.info(f"Webhook o'rnatildi: {WEBHOOK_URL}")
+        else:
+            logger.warning("WEBHOOK_URL ko'rsatilmagan: webhook o'rnatilmadi, faqat lokal so'rovlar qabul qilinadi")
+        if LOCAL_BOT_API_URL:
+            logger.warning(f"LOCAL_BOT_API_URL berilgan: bot so'rovlari Telegram'ga emas, {LOCAL_BOT_API_URL} ga yuboriladi")
+
+    async def shutdown(_):
+        await server.drain()
+        if on_shutdown is not None:
+            await on_shutdown(dp)
+        await dp.storage.close()
+        await dp.storage.wait_closed()
+        session = await dp.bot.get_session()
+        await session.close()
+
+    app.on_startup.append(startup)
+    app.on_shutdown.append(shutdown)
+    return app
+
+
+def start_webhook(dp, on_startup=None, on_shutdown=None, allowed_updates=None):
+    """Webhook serverini WEBHOOK_LISTEN_HOST:WEBHOOK_LISTEN_PORT da ishga tushiradi."""
+    server = WebhookServer(dp)
+    app = create_app(dp, server, on_startup, on_shutdown, allowed_updates)
+    web.run_app(app, host=WEBHOOK_LISTEN_HOST, port=WEBHOOK_LISTEN_PORT)